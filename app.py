@@ -12,9 +12,66 @@ import pandas as pd     # Para trabalhar com tabelas e dados
 import numpy as np      # Para cálculos matemáticos
 import plotly.express as px  # Para criar gráficos bonitos
 import plotly.graph_objects as go  # Para gráficos mais customizados
-import datetime, os, hashlib, re  # Utilitários do Python
+import pyarrow as pa     # Vem com o Streamlit; guarda as transações em Arrow (ver _read_dataset)
+import datetime, os, hashlib, re, sqlite3, contextlib, csv, io, threading, json, ast, logging, time  # Utilitários do Python
 from PIL import Image, UnidentifiedImageError  # Para trabalhar com imagens
 from pathlib import Path
+from abc import ABC, abstractmethod
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from collections import OrderedDict
+
+# Mensagens de diagnóstico (memória, tempos de carga...) vão para este logger,
+# que escreve no terminal do servidor (o Streamlit só configura os loggers dele)
+log = logging.getLogger("cupomgo")
+if not log.handlers:  # o script roda de novo a cada rerun: configura uma vez só
+    _log_saida = logging.StreamHandler()
+    _log_saida.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    log.addHandler(_log_saida)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+
+# Copy-on-write do pandas: recortes e cópias rasas dividem os dados com o
+# original e só copiam uma coluna quando alguém escreve nela. É isso que deixa
+# todas as sessões lerem a MESMA cópia dos dados (ver snapshot()).
+# O que muda com ele: atribuição encadeada (df[a][mask] = x) e inplace=True
+# numa coluna tirada do df (df[c].fillna(..., inplace=True)) deixam de alterar
+# o df; e os arrays de to_numpy() de dados compartilhados (e os do Arrow
+# mapeado) são só-leitura. O app não usa nenhum desses: as escritas são
+# df[c] = ... em quadros da própria sessão, e os rename(inplace=True) da
+# página de economia mudam só os nomes de uma cópia local. Regra para código
+# novo: um DataFrame compartilhado (get_dataset, cubo, recortes de tempo)
+# nunca recebe df[c] = ...; use df.assign(...) para ter um quadro próprio.
+pd.options.mode.copy_on_write = True
+
+# === Objetos compartilhados também nas threads de fundo ===
+# O que é compartilhado entre sessões fica em @st.cache_resource. Fora de uma
+# sessão (nas threads de fundo) esse cache não funciona e o Streamlit enche o
+# log de avisos, então as threads recebem os objetos quando são criadas
+# (start_background_thread) e shared() devolve esses mesmos objetos.
+_thread_local = threading.local()
+
+def _em_sessao() -> bool:
+    """True quando o código roda dentro de uma sessão do Streamlit."""
+    return get_script_run_ctx(suppress_warning=True) is not None
+
+def shared(getter):
+    """Objeto de um getter @st.cache_resource (sem argumentos), em qualquer thread."""
+    if not _em_sessao():
+        recursos = getattr(_thread_local, "recursos", None)
+        if recursos is not None and getter.__name__ in recursos:
+            return recursos[getter.__name__]
+    return getter()
+
+def start_background_thread(alvo, nome: str, *args):
+    """Cria (e liga) uma thread de fundo que já leva os objetos compartilhados."""
+    recursos = {g.__name__: g() for g in
+                (_cache_versions, _ready_generations, _dir_indices, _preload_em_andamento)}
+    def rodar():
+        _thread_local.recursos = recursos
+        alvo(*args)
+    t = threading.Thread(target=rodar, name=nome, daemon=True)
+    t.start()
+    return t
 
 # === SISTEMA DE AUTENTICAÇÃO PERSISTENTE ===
 def init_session_state():
@@ -37,10 +94,7 @@ def check_persistent_login():
     # Tenta recuperar o email de uma sessão anterior
     if not st.session_state.auth and "user_email" in st.session_state and st.session_state.user_email:
         # Verifica se o usuário ainda existe no banco de dados
-        df_users = load_users()
-        user_exists = not df_users.empty and any(df_users["email"] == st.session_state.user_email)
-        
-        if user_exists:
+        if buscar_usuario(st.session_state.user_email) is not None:
             st.session_state.auth = True
             st.session_state.page = st.session_state.get("page", "home")
             return True
@@ -80,16 +134,124 @@ def _list_data_files():
                 })
     return pd.DataFrame(items)
 
-def _find_file_case_insensitive(filename: str):
-    """Procura filename em DATA ignorando maiúsculas/minúsculas."""
-    p = DATA / filename
-    if p.exists():
-        return p
-    target = filename.lower()
-    for q in DATA.glob("*"):
-        if q.is_file() and q.name.lower() == target:
-            return q
-    return None
+# === Índice dos arquivos de data/ e assets/ ===
+# Procurar um arquivo listando a pasta inteira a cada chamada é caro em discos
+# de rede (Azure Files). Guardamos um índice nome -> caminho de cada pasta.
+# Em assets/ ele é refeito quando a data de modificação da PASTA muda (um
+# arquivo criado, apagado ou renomeado). Em data/ isso não serve: o SQLite
+# cria e apaga usuarios.db-wal/-shm a todo login, e a pasta "muda" o tempo
+# todo. Lá quem manda refazer é a thread de atualização, que só olha os
+# arquivos dos datasets vigiados (ver _refresher_loop); um nome que não está
+# no índice faz listar de novo, no máximo a cada REFRESH_INTERVAL_S.
+ASSETS = (BASE / "assets").resolve()
+
+@st.cache_resource(show_spinner=False)
+def _dir_indices():
+    """Índices das pastas (compartilhados por todas as sessões)."""
+    return {"lock": threading.Lock(), "pastas": {}, "geracoes": {}}
+
+def _dir_index(pasta: Path, idade_max: float = None):
+    """
+    (nomes exatos, nomes em minúsculas) -> Path dos arquivos da pasta.
+    Com 'idade_max' (segundos), um índice mais velho que isso é refeito.
+    """
+    estado = shared(_dir_indices)
+    try:
+        chave = estado["geracoes"].get(pasta, 0) if pasta == DATA else pasta.stat().st_mtime_ns
+    except OSError:
+        return {}, {}
+    with estado["lock"]:
+        atual = estado["pastas"].get(pasta)
+    if (atual is not None and atual[0] == chave
+            and (idade_max is None or time.monotonic() - atual[3] <= idade_max)):
+        return atual[1], atual[2]
+
+    exatos, minusculos = {}, {}
+    try:
+        with os.scandir(pasta) as entradas:
+            for e in entradas:
+                if e.is_file():
+                    q = pasta / e.name
+                    exatos[e.name] = q
+                    minusculos.setdefault(e.name.lower(), q)
+    except OSError:
+        return {}, {}
+    with estado["lock"]:
+        estado["pastas"][pasta] = (chave, exatos, minusculos, time.monotonic())
+    return exatos, minusculos
+
+def invalidate_dir_index(pasta: Path = DATA):
+    """Faz a próxima busca em 'pasta' listar a pasta de novo."""
+    estado = shared(_dir_indices)
+    with estado["lock"]:
+        estado["geracoes"][pasta] = estado["geracoes"].get(pasta, 0) + 1
+
+def _find_file_case_insensitive(filename: str, pasta: Path = DATA):
+    """Procura filename em DATA (ou em 'pasta') ignorando maiúsculas/minúsculas."""
+    exatos, minusculos = _dir_index(pasta)
+    p = exatos.get(filename) or minusculos.get(filename.lower())
+    if p is None:
+        # pode ter sido criado depois do índice (ex.: um arquivo fora dos vigiados)
+        exatos, minusculos = _dir_index(pasta, idade_max=REFRESH_INTERVAL_S)
+        p = exatos.get(filename) or minusculos.get(filename.lower())
+    return p
+
+# === Cache colunar (Parquet) para planilhas ===
+# Ler .xlsx com openpyxl é lento (XML célula por célula). Na primeira leitura
+# gravamos uma cópia em Parquet em data/.cache/ e, enquanto o arquivo original
+# não mudar (tamanho + data de modificação), lemos direto dessa cópia.
+CACHE_DIR = DATA / ".cache"
+
+def _cache_key(p: Path, extra: str = "") -> str:
+    """Assinatura do arquivo: muda sempre que ele é trocado ou editado."""
+    info = p.stat()
+    raw = f"{p.name}|{info.st_size}|{info.st_mtime_ns}|{extra}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+def _write_parquet_cache(df: pd.DataFrame, p: Path, cache: Path):
+    """Grava o Parquet de forma atômica e apaga versões antigas do mesmo arquivo."""
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        for old in CACHE_DIR.glob(f"{p.stem}.*.parquet"):
+            if old != cache:
+                old.unlink(missing_ok=True)
+        # nome temporário único: a carga em segundo plano e uma sessão podem gravar juntas
+        tmp = cache.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, cache)
+    except Exception:
+        # Sem pyarrow, disco só-leitura ou colunas com tipos misturados:
+        # seguimos sem cache, o app continua funcionando normalmente.
+        pass
+
+def _excel_cache_path(p: Path, sheet_name=0, **kwargs):
+    """Onde fica o Parquet desta planilha (None se não dá para cachear)."""
+    if sheet_name is None:  # sheet_name=None devolve um dict de abas: não cacheamos
+        return None
+    try:
+        extra = repr((sheet_name, sorted(kwargs.items())))
+        return CACHE_DIR / f"{p.stem}.{_cache_key(p, extra)}.parquet"
+    except OSError:
+        return None
+
+def _read_excel_cached(p: Path, sheet_name=0, **kwargs):
+    """
+    Lê uma planilha usando o cache Parquet quando ele ainda é válido.
+    Se não houver cache (ou ele estiver desatualizado), lê o Excel e grava o cache.
+    """
+    cache = _excel_cache_path(p, sheet_name, **kwargs)
+    if cache is not None and not cache.exists():
+        _esperar_preload(p)
+    if cache is not None and cache.exists():
+        try:
+            return pd.read_parquet(cache)
+        except Exception:
+            pass  # cache corrompido: volta a ler o Excel
+
+    df = pd.read_excel(p, sheet_name=sheet_name, engine="openpyxl", **kwargs)
+    if cache is not None:
+        _write_parquet_cache(df, p, cache)
+    return df
 
 @st.cache_data(show_spinner=False)
 def load_csv(name, **kwargs):
@@ -120,8 +282,8 @@ def load_xlsx(name, sheet_name=0, **kwargs):
         return pd.DataFrame()
 
     try:
-        # engine explícita para ambientes server
-        return pd.read_excel(p, sheet_name=sheet_name, engine="openpyxl", **kwargs)
+        # engine explícita para ambientes server (com cache colunar ao lado)
+        return _read_excel_cached(p, sheet_name=sheet_name, **kwargs)
     except Exception as e:
         st.error(f"❌ Erro ao ler **{p.name}**: {e}")
         return pd.DataFrame()
@@ -141,8 +303,8 @@ def read_table(filename: str, sheet_name=0, **kwargs):
     ext = p.suffix.lower()
     try:
         if ext in (".xlsx", ".xls"):
-            # engine explícita para ambientes server
-            return pd.read_excel(p, sheet_name=sheet_name, engine="openpyxl", **kwargs)
+            # engine explícita para ambientes server (com cache colunar ao lado)
+            return _read_excel_cached(p, sheet_name=sheet_name, **kwargs)
         elif ext == ".csv":
             return pd.read_csv(p, **kwargs)
         else:
@@ -166,61 +328,574 @@ def read_any(candidates, **kwargs):
     st.error("❌ Nenhum dos arquivos foi encontrado: " + ", ".join(candidates))
     return pd.DataFrame()
 
-# ---------------- Carregamento dos Dados ----------------
-# Carrega todos os arquivos usando o sistema robusto
-# CORREÇÃO: Tenta diferentes variações de nome para conquista.csv
-try:
-    conquista = read_any(["conquista.csv", "conquistas.csv", "achievements.csv"])
-except:
-    conquista = pd.DataFrame()
-
-try:
-    cupom_usos = load_csv("cupom_usos.csv")
-except:
-    cupom_usos = pd.DataFrame()
-
-try:
-    economia = load_csv("economia.csv")
-except:
-    economia = pd.DataFrame()
-
-try:
-    usuarios = load_csv("usuarios.csv")
-except:
-    usuarios = pd.DataFrame()
-
-try:
-    lojas = load_xlsx("lojas.xlsx")
-except:
-    lojas = pd.DataFrame()
-
-try:
-    pedestres = load_xlsx("pedestres.xlsx")
-except:
-    pedestres = pd.DataFrame()
-
-try:
-    players = load_xlsx("players.xlsx")
-except:
-    players = pd.DataFrame()
-
-try:
-    transacoes = load_xlsx("transacoes.xlsx")
-except:
-    transacoes = pd.DataFrame()
-
-# ---------------- Carregamento dos Dados ----------------
-# Atualiza as variáveis principais com os dados carregados
-df_transacoes = transacoes if not transacoes.empty else pd.DataFrame()
-df_lojas = lojas if not lojas.empty else pd.DataFrame()
-df_players = players if not players.empty else pd.DataFrame()
-df_pedestres = pedestres if not pedestres.empty else pd.DataFrame()
-df_economia = economia if not economia.empty else pd.DataFrame()
-
-# Antes de plotar, cheque se veio
-if not df_transacoes.empty:
-    # ... seus gráficos aqui
-    pass
+# === CSV de transações muito grande: leitura em pedaços ===
+# Um transacoes.csv de vários GB não cabe inteiro na memória. A partir deste
+# tamanho, o cubo de agregados é montado lendo o arquivo em pedaços (ver
+# stream_transaction_cube) e o dataset "transacoes" guarda só as primeiras
+# linhas, usadas pelas visões que precisam de linhas individuais.
+CSV_STREAMING_MIN_BYTES = 256 * 2**20   # 256 MB
+CSV_CHUNK_ROWS = 500_000                # linhas por pedaço
+CSV_PREVIEW_ROWS = 50_000               # linhas guardadas no dataset em modo pedaços
+
+def _csv_grande(candidates):
+    """Caminho do arquivo que read_any leria, se for um CSV grande demais para ler inteiro."""
+    for name in candidates:
+        p = _find_file_case_insensitive(name)
+        if p is not None:
+            if p.suffix.lower() == ".csv" and p.stat().st_size >= CSV_STREAMING_MIN_BYTES:
+                return p
+            return None
+    return None
+
+def read_transacoes(candidates, **kwargs):
+    """
+    Igual a read_any, mas se as transações vierem de um CSV muito grande,
+    lê só as primeiras CSV_PREVIEW_ROWS linhas (o cubo lê o arquivo todo em pedaços).
+    """
+    p = _csv_grande(candidates)
+    if p is not None:
+        log.info("transacoes: %s tem %.0f MB, usando leitura em pedaços",
+                 p.name, p.stat().st_size / 2**20)
+        return read_table(p.name, nrows=CSV_PREVIEW_ROWS, **kwargs)
+    return read_any(candidates, **kwargs)
+
+# ---------------- Versões de Cache (invalidação por tabela) ----------------
+# Em vez de apagar TODO o cache quando algo é gravado, cada tabela tem um
+# número de versão que entra na chave dos caches que dependem dela. Gravar
+# em "usuarios" só muda a versão de "usuarios" (e de quem depende dela);
+# transações, lojas e economia continuam no cache das outras sessões.
+# Também dá para versionar por chave (ex.: um único e-mail em "usuarios").
+CACHE_DEPENDENCIES = {
+    # tabela: caches derivados que também precisam ser refeitos
+    "transacoes": ["cubo_transacoes"],
+    "usuarios": [],
+    "cupom_usos": [],
+}
+
+@st.cache_resource(show_spinner=False)
+def _cache_versions():
+    """Contadores de versão compartilhados por todas as sessões do processo."""
+    return {"lock": threading.Lock(), "versoes": {}}
+
+def _dependents(table: str):
+    """Tabela + tudo que depende dela (em cascata)."""
+    found, pending = [], [table]
+    while pending:
+        t = pending.pop()
+        if t not in found:
+            found.append(t)
+            pending.extend(CACHE_DEPENDENCIES.get(t, []))
+    return found
+
+def cache_version(table: str, key=None):
+    """
+    Versão atual de uma tabela (ou de uma chave dentro dela).
+    Use o valor como argumento extra das funções com @st.cache_data.
+    """
+    versoes = shared(_cache_versions)["versoes"]
+    if key is None:
+        return versoes.get((table, "*"), 0)
+    return versoes.get((table, None), 0), versoes.get((table, str(key).strip().lower()), 0)
+
+def invalidate_cache(table: str, key=None):
+    """
+    Marca a tabela (ou só uma chave dela) como alterada.
+    Caches de outras tabelas não são afetados.
+    """
+    state = shared(_cache_versions)
+    with state["lock"]:
+        _incrementar_versoes(state["versoes"], table, key)
+
+def _incrementar_versoes(versoes: dict, table: str, key=None):
+    """Soma 1 nas versões (chame com o lock de _cache_versions na mão)."""
+    for t in _dependents(table):
+        versoes[(t, "*")] = versoes.get((t, "*"), 0) + 1
+        if key is None or t != table:
+            versoes[(t, None)] = versoes.get((t, None), 0) + 1
+    if key is not None:
+        k = (table, str(key).strip().lower())
+        versoes[k] = versoes.get(k, 0) + 1
+
+# ---------------- Normalização de Tipos (schema) ----------------
+# Planilhas chegam com textos repetidos como "object" (strings do Python) e
+# valores em float64. Depois de ler, ajustamos os tipos UMA vez:
+# - textos com poucos valores distintos viram "category" (códigos inteiros);
+# - colunas de data em texto viram datetime64;
+# - números ficam no menor tipo que guarda os valores sem perder nada.
+# Colunas de dinheiro (valor, receita, custo...) continuam float64: cada
+# valor cabe em float32, mas somar um milhão deles em float32 já erra centavos
+# no total (e os totais são o que o painel mostra).
+SCHEMA_MAX_DISTINTOS = 0.5  # até 50% de valores distintos ainda vale virar "category"
+COLUNAS_DINHEIRO = ("valor", "receita", "desconto", "custo", "lucro", "investimento", "preco", "preço", "ticket")
+SCHEMA_VERSAO = 2  # mude quando os tipos escolhidos mudarem: os Arrow já gravados são refeitos
+
+def _is_date_name(col) -> bool:
+    nome = str(col).strip().lower()
+    return "data" in nome or "date" in nome
+
+def _is_money_name(col) -> bool:
+    nome = str(col).strip().lower()
+    return any(p in nome for p in COLUNAS_DINHEIRO)
+
+def _downcast_float(s: pd.Series) -> pd.Series:
+    """float64 -> float32 só se todos os valores voltam iguais (em centavos)."""
+    s32 = s.astype("float32")
+    volta = s32.astype("float64").round(2)
+    iguais = (volta == s.round(2)) & (s.round(2) == s)
+    return s32 if bool((iguais | s.isna()).all()) else s
+
+def _downcast_int(s: pd.Series) -> pd.Series:
+    """int64 -> int32 se couber (menor que isso arrisca estourar em contas)."""
+    info = np.iinfo("int32")
+    if s.empty or (s.min() >= info.min and s.max() <= info.max):
+        return s.astype("int32")
+    return s
+
+def normalize_schema(df: pd.DataFrame, nome: str = "dataset") -> pd.DataFrame:
+    """
+    Ajusta os tipos das colunas (ver explicação acima) e registra no log
+    quanto de memória o DataFrame usava antes e depois.
+    """
+    if df.empty:
+        return df
+    antes = int(df.memory_usage(deep=True).sum())
+    limite = max(1, int(len(df) * SCHEMA_MAX_DISTINTOS))
+
+    for c in df.columns:
+        s = df[c]
+        if pd.api.types.is_object_dtype(s.dtype):
+            if _is_date_name(c):
+                datas = pd.to_datetime(s, errors="coerce")
+                if datas.notna().sum() >= 0.9 * s.notna().sum():
+                    df[c] = datas
+                    continue
+            if s.nunique(dropna=True) <= limite:
+                df[c] = s.astype("category")
+        elif pd.api.types.is_bool_dtype(s.dtype):
+            continue
+        elif pd.api.types.is_integer_dtype(s.dtype):
+            df[c] = _downcast_int(s)
+        elif pd.api.types.is_float_dtype(s.dtype) and not _is_money_name(c):
+            df[c] = _downcast_float(s)
+
+    depois = int(df.memory_usage(deep=True).sum())
+    log.info("schema %s: %d linhas, memória %.1f MB -> %.1f MB",
+             nome, len(df), antes / 2**20, depois / 2**20)
+    return df
+
+# ---------------- Registro de Datasets (carregamento sob demanda) ----------------
+# Nenhuma planilha é lida quando o app abre. Cada dataset diz de quais arquivos
+# vem (na ordem de preferência), qual função lê esses arquivos e quais colunas
+# as páginas esperam encontrar nele. As páginas pedem com get_dataset("nome"),
+# então a tela de login e a página "Sobre" não pagam nada por isso.
+# "normalizar" (opcional) ajusta os tipos logo depois da leitura.
+DATASETS = {
+    "transacoes": {
+        "arquivos": ["transacoes.xlsx", "transações.xlsx", "transacoes.csv"],
+        "loader": read_transacoes,
+        "normalizar": normalize_schema,
+        "arrow": True,  # cópia normalizada em Arrow, mapeada na memória
+        "preload": True,  # as páginas usam logo: lida em segundo plano depois do login
+        "colunas": ["data_captura", "nome_loja", "tipo_cupom", "categoria_estabelecimento",
+                    "tipo_loja", "valor_compra", "valor_cupom", "custo_venda", "lucro_bruto"],
+    },
+    "lojas": {
+        "arquivos": ["lojas.xlsx"],
+        "loader": read_any,
+        "colunas": ["nome_loja", "tipo_loja", "endereco_loja", "latitude", "longitude"],
+    },
+    "economia": {
+        "arquivos": ["economia.csv"],
+        "loader": read_any,
+        "colunas": ["date", "SELIC_pct_a.m.", "IPCA_pct_a.m.", "Inadimplencia_pct"],
+    },
+    "cupom_usos": {
+        "arquivos": ["cupom_usos.csv"],
+        "loader": read_any,
+        "colunas": ["email", "data", "loja", "tipo", "valor", "local"],
+        # o próprio app acrescenta linhas (RegistroUsosCupom) e já troca a
+        # versão; a thread de atualização não precisa reler a cada cupom
+        "vigiar": False,
+    },
+    # Os três abaixo não são usados por nenhuma página hoje, mas ficam
+    # registrados para quem precisar deles (só são lidos se alguém pedir).
+    "conquistas": {
+        "arquivos": ["conquista.csv", "conquistas.csv", "achievements.csv"],
+        "loader": read_any,
+        "colunas": ["id", "nome", "descricao", "tipo", "pontos", "icone"],
+    },
+    "players": {
+        "arquivos": ["players.xlsx"],
+        "loader": read_any,
+        "colunas": [],
+    },
+    "pedestres": {
+        "arquivos": ["pedestres.xlsx"],
+        "loader": read_any,
+        "colunas": [],
+    },
+}
+
+# === Transações em Arrow mapeado na memória (compartilhado entre processos) ===
+# O snapshot divide os dados entre as sessões de UM processo, mas cada worker
+# atrás do balanceador ainda teria a sua cópia. Para os datasets com
+# "arrow": True, a versão já normalizada é gravada em data/.cache/ como um
+# arquivo Arrow IPC (Feather v2, sem compressão) e cada processo abre esse
+# arquivo com pa.memory_map. As colunas do DataFrame apontam direto para as
+# páginas do arquivo, que o sistema operacional guarda UMA vez na memória
+# para todos os processos: cada worker a mais custa quase nada.
+# Os tipos continuam os de sempre (datetime64, category, float32...), e não
+# pd.ArrowDtype: o resto do app usa NumPy e funciona sem mudança nenhuma.
+# Os arrays ficam só-leitura; com o copy-on-write quem altera uma coluna
+# ganha a sua cópia dela, como já acontecia com o snapshot.
+def _arquivo_do_dataset(name: str):
+    """Arquivo de onde o dataset é lido (o primeiro candidato que existe), ou None."""
+    for arquivo in DATASETS[name]["arquivos"]:
+        p = _find_file_case_insensitive(arquivo)
+        if p is not None:
+            return p
+    return None
+
+def _arrow_cache_path(name: str):
+    """Onde fica o Arrow do dataset (None se o arquivo de origem não existe)."""
+    p = _arquivo_do_dataset(name)
+    try:
+        return CACHE_DIR / f"{name}.{_cache_key(p, f'{name}|{SCHEMA_VERSAO}')}.arrow" if p is not None else None
+    except OSError:
+        return None
+
+def _coluna_arrow(s: pd.Series) -> pa.Array:
+    """Coluna em Arrow; NaN de float continua NaN (null obrigaria a copiar ao abrir)."""
+    if pd.api.types.is_float_dtype(s.dtype):
+        return pa.array(s.to_numpy(), from_pandas=False)
+    return pa.Array.from_pandas(s)
+
+def _write_arrow_cache(df: pd.DataFrame, name: str, cache: Path):
+    """Grava o Arrow de forma atômica e apaga as versões antigas deste dataset."""
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tabela = pa.Table.from_arrays([_coluna_arrow(df.iloc[:, i]) for i in range(df.shape[1])],
+                                      names=[str(c) for c in df.columns])
+        tmp = cache.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with pa.OSFile(str(tmp), "wb") as destino:
+            with pa.ipc.new_file(destino, tabela.schema) as escritor:
+                escritor.write_table(tabela)
+        os.replace(tmp, cache)
+    except Exception:
+        # Disco só-leitura ou colunas com tipos misturados: seguimos sem o Arrow.
+        log.warning("não deu para gravar %s", cache.name, exc_info=True)
+        return
+    for old in CACHE_DIR.glob(f"{name}.*.arrow"):
+        if old != cache:
+            try:
+                old.unlink(missing_ok=True)  # quem ainda tem o antigo mapeado continua lendo
+            except OSError:
+                pass  # Windows não apaga arquivo mapeado: fica para a próxima troca
+
+def _open_arrow_cache(cache: Path):
+    """DataFrame que lê direto do arquivo mapeado (None se não deu para abrir)."""
+    try:
+        tabela = pa.ipc.open_file(pa.memory_map(str(cache), "r")).read_all()
+        # split_blocks: uma coluna por bloco, sem juntar (e copiar) colunas do mesmo tipo
+        return tabela.to_pandas(split_blocks=True)
+    except Exception:
+        return None  # arquivo corrompido ou incompleto: volta a ler a planilha
+
+def _read_dataset(name: str) -> pd.DataFrame:
+    """Lê o dataset registrado em DATASETS[name] dos arquivos (ou do Arrow, se estiver em dia)."""
+    spec = DATASETS[name]
+    cache = _arrow_cache_path(name) if spec.get("arrow") else None
+    if cache is not None and cache.exists():
+        df = _open_arrow_cache(cache)
+        if df is not None:
+            log.info("dataset %s: %d linhas mapeadas de %s", name, len(df), cache.name)
+            return df
+    try:
+        df = spec["loader"](spec["arquivos"])
+    except Exception:
+        return pd.DataFrame()
+    if "normalizar" in spec:
+        try:
+            # cópia rasa: se falhar no meio, 'df' continua com os tipos originais
+            df = spec["normalizar"](df.copy(deep=False), nome=name)
+        except Exception:
+            # ex.: coluna com valores que não dá para comparar (listas, dicts):
+            # a página recebe os dados como vieram, sem os tipos ajustados
+            log.warning("dataset %s: não deu para ajustar os tipos", name, exc_info=True)
+    if cache is not None and not df.empty:
+        _write_arrow_cache(df, name, cache)
+        # reabre mapeado: este processo também passa a usar as páginas do arquivo
+        mapeado = _open_arrow_cache(cache) if cache.exists() else None
+        if mapeado is not None:
+            return mapeado
+    return df
+
+# === Dados compartilhados entre sessões (snapshot) ===
+# Com @st.cache_data cada sessão recebia a sua cópia do DataFrame (o cache
+# guarda os dados em pickle e desempacota a cada acesso). Os datasets e o cubo
+# ficam em @st.cache_resource: UMA cópia em memória para todas as sessões.
+# Quem pede recebe snapshot(df): um DataFrame novo que aponta para os mesmos
+# dados; com o copy-on-write, se a página criar ou mudar uma coluna, só essa
+# coluna é copiada e a cópia compartilhada continua intacta.
+def snapshot(df: pd.DataFrame) -> pd.DataFrame:
+    """Visão própria (sem copiar os dados) de um DataFrame compartilhado."""
+    return df.copy(deep=False)
+
+# O cache guarda UMA geração por dataset (a chave é só o nome): quando a
+# versão muda, _geracao_em_dia reprova a entrada e a geração anterior sai do
+# cache na hora, junto com o Arrow mapeado dela, em vez de ficar esperando
+# outras versões a empurrarem para fora.
+def _geracao_em_dia(geracao) -> bool:
+    """A geração guardada (nome, versão, df) ainda é a versão atual do dataset?"""
+    name, version, _ = geracao
+    return version == cache_version(name)
+
+@st.cache_resource(show_spinner=False, max_entries=len(DATASETS), validate=_geracao_em_dia)
+def _load_dataset(name: str):
+    """(nome, versão, df) do dataset na versão atual (uma cópia para todas as sessões)."""
+    version = cache_version(name)
+    pronto = _take_ready_generation(name, version)
+    return name, version, (pronto if pronto is not None else _read_dataset(name))
+
+def get_dataset(name: str) -> pd.DataFrame:
+    """
+    Devolve o dataset pedido, lendo o arquivo só na primeira vez que alguém precisa dele.
+    Exemplo: tx = get_dataset("transacoes")
+    """
+    if name not in DATASETS:
+        raise KeyError(f"Dataset desconhecido: {name}")
+    return snapshot(_load_dataset(name)[2])
+
+# ---------------- Carga das Planilhas em Segundo Plano ----------------
+# Depois do login, as planilhas dos datasets com "preload": True (os que as
+# páginas usam) que ainda não têm cópia em Parquet (nem Arrow) são lidas numa
+# thread de fundo, uma de cada vez, e as cópias ficam em data/.cache/. A
+# leitura lenta do openpyxl começa enquanto o usuário ainda está na primeira
+# página; quem pedir o dataset durante a leitura espera por ela em vez de ler
+# a mesma planilha de novo. A tela de login não dispara leitura nenhuma.
+# É uma leitura só por vez: hoje só "transacoes" tem "preload", e um processo
+# a mais (o openpyxl não solta o GIL) custa mais para subir do que economiza.
+def _planilhas_sem_cache(names=None):
+    """(dataset, planilha) das planilhas registradas sem Parquet (ou Arrow) válido."""
+    pendentes = []
+    if names is None:
+        names = [name for name, spec in DATASETS.items() if spec.get("preload")]
+    for name in names:
+        if DATASETS[name].get("arrow"):
+            arrow = _arrow_cache_path(name)
+            if arrow is not None and arrow.exists():
+                continue  # o dataset já abre do Arrow, sem ler a planilha
+        for arquivo in DATASETS[name]["arquivos"]:
+            p = _find_file_case_insensitive(arquivo)
+            if p is None:
+                continue
+            cache = _excel_cache_path(p) if p.suffix.lower() in (".xlsx", ".xls") else None
+            if cache is not None and not cache.exists():
+                pendentes.append((name, p))
+            break  # read_any usa o primeiro arquivo que existir
+    return pendentes
+
+@st.cache_resource(show_spinner=False)
+def _preload_em_andamento():
+    """{caminho da planilha: Event} das planilhas que a carga em segundo plano vai ler."""
+    return {"lock": threading.Lock(), "eventos": {}}
+
+def _esperar_preload(p: Path, timeout: float = 120.0):
+    """Se a carga em segundo plano está lendo esta planilha, espera em vez de ler de novo."""
+    estado = shared(_preload_em_andamento)
+    with estado["lock"]:
+        evento = estado["eventos"].get(str(p))
+    if evento is not None:
+        evento.wait(timeout)
+
+def _reservar_planilhas(names=None):
+    """
+    Marca as planilhas sem cache como "em leitura" (quem pedir espera) e
+    devolve [(dataset, planilha, Event)].
+    """
+    pendentes = [(name, p, threading.Event()) for name, p in _planilhas_sem_cache(names)]
+    estado = shared(_preload_em_andamento)
+    with estado["lock"]:
+        for _, p, evento in pendentes:
+            estado["eventos"][str(p)] = evento
+    return pendentes
+
+def _liberar_planilha(p: Path, evento: threading.Event):
+    estado = shared(_preload_em_andamento)
+    with estado["lock"]:
+        if estado["eventos"].get(str(p)) is evento:
+            del estado["eventos"][str(p)]
+    evento.set()
+
+def _ler_planilhas(pendentes):
+    """Lê as planilhas reservadas, grava os Parquet e libera quem está esperando."""
+    t0 = time.perf_counter()
+    resultados = {}
+    try:
+        for name, p, evento in pendentes:
+            t = time.perf_counter()
+            try:
+                df = pd.read_excel(p, sheet_name=0, engine="openpyxl")
+                _write_parquet_cache(df, p, _excel_cache_path(p))
+                resultados[name] = df
+                log.info("carga em segundo plano: %s (%d linhas) em %.1fs",
+                         p.name, len(df), time.perf_counter() - t)
+            except Exception:
+                log.exception("falha ao ler %s na carga em segundo plano", p.name)
+            finally:
+                _liberar_planilha(p, evento)
+    finally:
+        for _, p, evento in pendentes:  # nada fica esperando para sempre
+            if not evento.is_set():
+                _liberar_planilha(p, evento)
+    if pendentes:
+        log.info("carga em segundo plano: %d planilhas em %.1fs", len(resultados), time.perf_counter() - t0)
+    return resultados
+
+def preload_spreadsheets(names=None):
+    """
+    Lê, uma de cada vez, as planilhas dos datasets 'names' (os com "preload",
+    se None) que não têm cache e grava as cópias em Parquet.
+    Devolve {dataset: DataFrame} com o que foi lido.
+    """
+    return _ler_planilhas(_reservar_planilhas(names))
+
+@st.cache_resource(show_spinner=False)
+def start_preload():
+    """Dispara (uma vez por processo) a leitura das planilhas, sem travar a página."""
+    # reserva aqui, antes da página pedir o dataset: ela espera a thread em vez de ler junto
+    pendentes = _reservar_planilhas()
+    if not pendentes:
+        return None
+    def carregar():
+        try:
+            _ler_planilhas(pendentes)
+        except Exception:
+            log.exception("falha na carga das planilhas em segundo plano")
+    return start_background_thread(carregar, "cupomgo-preload")
+
+# ---------------- Atualização em Segundo Plano ----------------
+# Uma thread olha a pasta data/ de tempos em tempos (data de modificação e
+# tamanho dos arquivos dos datasets vigiados; usuarios.db, seus -wal/-shm e
+# cupom_usos.csv mudam a cada login ou cupom e ficam de fora, senão a troca
+# nunca ficaria "parada"). Quando um arquivo de algum dataset muda (e para
+# de mudar), ela lê o arquivo de novo FORA das requisições, monta a próxima
+# "geração" (dataset e, para transações, o cubo) e só então troca a versão.
+# Até a troca, todas as sessões continuam vendo os dados anteriores; depois
+# dela, a primeira sessão só pega a geração pronta, sem ler arquivo nenhum.
+REFRESH_INTERVAL_S = 5  # segundos entre uma olhada e outra na pasta
+
+@st.cache_resource(show_spinner=False)
+def _ready_generations():
+    """Gerações montadas em segundo plano, esperando a primeira sessão pegar."""
+    return {"lock": threading.Lock(), "itens": {}}
+
+def _put_ready_generation(table: str, version, valor):
+    prontas = shared(_ready_generations)
+    with prontas["lock"]:
+        itens = prontas["itens"]
+        # uma geração nova da mesma tabela torna as anteriores inúteis
+        for chave in [k for k in itens if k[0] == table]:
+            del itens[chave]
+        itens[(table, version)] = valor
+
+def _publicar_geracoes(name: str, versao_lida, geracoes: dict) -> bool:
+    """
+    Deixa as gerações ({tabela: valor}) prontas nas próximas versões e troca as
+    versões, tudo com o lock das versões na mão. Se a versão de 'name' mudou
+    desde a leitura (alguém gravou no meio dela), os dados lidos podem estar
+    velhos: nada é publicado e devolve False.
+    """
+    state = shared(_cache_versions)
+    with state["lock"]:
+        versoes = state["versoes"]
+        if versoes.get((name, "*"), 0) != versao_lida:
+            return False
+        for tabela, valor in geracoes.items():
+            _put_ready_generation(tabela, versoes.get((tabela, "*"), 0) + 1, valor)
+        _incrementar_versoes(versoes, name)
+    return True
+
+def _take_ready_generation(table: str, version):
+    """Retira (se houver) a geração pronta de 'table' nesta versão."""
+    prontas = shared(_ready_generations)
+    with prontas["lock"]:
+        return prontas["itens"].pop((table, version), None)
+
+def _arquivos_vigiados() -> set:
+    """Nomes (em minúsculas) dos arquivos dos datasets com "vigiar" (o padrão)."""
+    return {a.lower() for spec in DATASETS.values() if spec.get("vigiar", True)
+            for a in spec["arquivos"]}
+
+def _data_snapshot() -> dict:
+    """{nome do arquivo em minúsculas: (mtime, tamanho)} dos arquivos vigiados em data/."""
+    fotos, vigiados = {}, _arquivos_vigiados()
+    try:
+        with os.scandir(DATA) as entradas:
+            for e in entradas:
+                if e.name.lower() in vigiados and e.is_file():
+                    info = e.stat()
+                    fotos[e.name.lower()] = (info.st_mtime_ns, info.st_size)
+    except OSError:
+        pass
+    return fotos
+
+def _datasets_afetados(antes: dict, depois: dict):
+    """Datasets que usam algum arquivo criado, apagado ou alterado."""
+    mudaram = {n for n in antes.keys() | depois.keys() if antes.get(n) != depois.get(n)}
+    return [nome for nome, spec in DATASETS.items()
+            if spec.get("vigiar", True) and mudaram & {a.lower() for a in spec["arquivos"]}]
+
+def refresh_dataset(name: str):
+    """
+    Monta a próxima geração de um dataset (e do cubo, se for "transacoes")
+    e só então troca a versão. Quem pedir o dataset durante a leitura recebe
+    o anterior. Devolve False se o arquivo existe mas ainda não deu para ler
+    (ex.: está sendo gravado) ou se o dataset mudou durante a leitura; aí nada
+    é trocado e a thread tenta de novo depois.
+    """
+    t0 = time.perf_counter()
+    versao_lida = cache_version(name)
+    df = _read_dataset(name)
+    if df.empty and any(_find_file_case_insensitive(a) for a in DATASETS[name]["arquivos"]):
+        log.info("dataset %s ainda não pôde ser lido; tentando de novo depois", name)
+        return False
+    geracoes = {name: df}
+    if name == "transacoes" and not df.empty:
+        csv_grande = _csv_grande(DATASETS["transacoes"]["arquivos"])
+        geracoes["cubo_transacoes"] = (stream_transaction_cube(csv_grande) if csv_grande is not None
+                                       else update_transaction_cube(df, _arquivo_do_dataset(name)))
+    if not _publicar_geracoes(name, versao_lida, geracoes):
+        log.info("dataset %s mudou durante a leitura; tentando de novo depois", name)
+        return False
+    log.info("dataset %s atualizado em segundo plano (%.1fs)", name, time.perf_counter() - t0)
+    return True
+
+def _refresher_loop(intervalo: float):
+    estavel = vistas = _data_snapshot()
+    while True:
+        time.sleep(intervalo)
+        try:
+            novas = _data_snapshot()
+            if novas != vistas:
+                # ainda mudando (ex.: arquivo sendo copiado): espera ficar parado
+                vistas = novas
+                continue
+            if novas.keys() != estavel.keys():
+                invalidate_dir_index(DATA)  # arquivo criado, apagado ou renomeado
+            falhou = set()
+            for nome in _datasets_afetados(estavel, novas):
+                if not refresh_dataset(nome):
+                    falhou |= {a.lower() for a in DATASETS[nome]["arquivos"]}
+            # arquivos que falharam continuam "diferentes" para a próxima tentativa
+            estavel = {n: (estavel.get(n) if n in falhou else v) for n, v in novas.items()}
+        except Exception:
+            log.exception("falha ao atualizar os dados em segundo plano")
+
+@st.cache_resource(show_spinner=False)
+def start_data_refresher(intervalo: float = REFRESH_INTERVAL_S):
+    """Liga (uma única vez por processo) a thread que vigia a pasta data/."""
+    return start_background_thread(_refresher_loop, "cupomgo-data-refresher", intervalo)
 
 # Cor principal da nossa marca - usada em botões, títulos e gráficos
 PRIMARY = "#0C2D6B"
@@ -248,11 +923,10 @@ inject_css_file()
 def get_data_path(filename):
     """Obtém caminho seguro para arquivos de dados"""
     data_file = _find_file_case_insensitive(filename)
-    if data_file and data_file.exists():
+    if data_file:
         return data_file
     # Fallback para assets se existir
-    assets_file = BASE / "assets" / filename
-    return assets_file if assets_file.exists() else None
+    return _find_file_case_insensitive(filename, ASSETS)
 
 PATH_TX = get_data_path("transacoes.xlsx")
 PATH_STORES = get_data_path("lojas.xlsx")
@@ -262,16 +936,94 @@ CUPOM_USOS_PATH = get_data_path("cupom_usos.csv")
 CONQUISTAS_PATH = get_data_path("conquistas.csv")
 
 # ======== Interatividade global para TODOS os gráficos ========
+FREQS_TEMPO = {"Mês": "M", "Semana": "W-MON", "Dia": "D"}
+MAX_INDICES_TEMPO = 8     # quantas versões de dados ordenados guardamos
+MAX_JANELAS_TEMPO = 64    # quantos recortes (versão, início, fim, freq) guardamos
+
+@st.cache_resource(show_spinner=False)
+def _time_window_cache():
+    """
+    Guarda, para todas as sessões:
+    - "indices": os dados ordenados por data (uma cópia por versão dos dados);
+    - "janelas": os recortes já feitos para cada (versão, início, fim, freq).
+    Os dois são LRU: quando enchem, sai o que foi usado há mais tempo.
+    """
+    return {"lock": threading.Lock(), "indices": OrderedDict(), "janelas": OrderedDict()}
+
+def _lru_get(tabela: OrderedDict, chave):
+    valor = tabela.get(chave)
+    if valor is not None:
+        tabela.move_to_end(chave)
+    return valor
 
-def add_time_widgets(df, dcol, key_suffix=""):
+def _lru_put(tabela: OrderedDict, chave, valor, limite: int):
+    tabela[chave] = valor
+    tabela.move_to_end(chave)
+    while len(tabela) > limite:
+        tabela.popitem(last=False)
+
+def _sorted_time_index(df, dcol, version):
+    """
+    Ordena os dados pela data UMA vez por versão (a única cópia dos dados que
+    fica guardada). Devolve (ordenado, datas, n_validas): 'datas' é o array
+    datetime64 ordenado (datas vazias ficam no fim) usado na busca binária.
+    """
+    cache = _time_window_cache()
+    chave = (version, dcol)
+    with cache["lock"]:
+        indice = _lru_get(cache["indices"], chave)
+    if indice is not None:
+        return indice
+
+    ordenado = df.assign(**{dcol: pd.to_datetime(df[dcol], errors="coerce")})
+    ordenado = ordenado.sort_values(dcol, kind="stable", na_position="last", ignore_index=True)
+    datas = ordenado[dcol].to_numpy(dtype="datetime64[ns]")
+    indice = (ordenado, datas, int(ordenado[dcol].notna().sum()))
+
+    with cache["lock"]:
+        _lru_put(cache["indices"], chave, indice, MAX_INDICES_TEMPO)
+    return indice
+
+def _time_window(df, dcol, version, start, end, freq):
+    """
+    Recorte [start, end] dos dados já ordenados, com a coluna 'Periodo' da freq pedida.
+    O recorte é uma busca binária (searchsorted) + fatia contínua (iloc), que é uma
+    "view" dos dados ordenados; só a coluna 'Periodo' é calculada, e só para a
+    fatia. O resultado fica memorizado: reruns com os mesmos filtros (ex.:
+    ligar/desligar "Mostrar marcadores") não refazem nada.
+    """
+    cache = _time_window_cache()
+    chave = (version, dcol, start, end, freq)
+    with cache["lock"]:
+        janela = _lru_get(cache["janelas"], chave)
+    if janela is not None:
+        return janela
+
+    ordenado, datas, n_validas = _sorted_time_index(df, dcol, version)
+    if start and end:
+        validas = datas[:n_validas]
+        ini = np.searchsorted(validas, np.datetime64(pd.Timestamp(start)), side="left")
+        fim = np.searchsorted(validas, np.datetime64(pd.Timestamp(end) + pd.Timedelta(days=1)), side="left")
+        janela = ordenado.iloc[ini:fim]
+    else:
+        janela = ordenado
+    janela = janela.assign(Periodo=cube_periods(janela[dcol], freq))
+
+    with cache["lock"]:
+        _lru_put(cache["janelas"], chave, janela, MAX_JANELAS_TEMPO)
+    return janela
+
+def add_time_widgets(df, dcol, version, key_suffix=""):
     """
     Widget de intervalo de datas + agregação (mês/semana/dia).
-    Retorna df recortado e a 'freq' escolhida.
+    Retorna df recortado (já com a coluna 'Periodo') e a 'freq' escolhida.
+    'version' identifica os dados (ex.: meta["versao"] do cubo): a ordenação é
+    feita uma vez por versão e cada recorte fica memorizado. O df devolvido é
+    compartilhado entre sessões: use só para leitura.
     """
-    df = df.copy()
-    df[dcol] = pd.to_datetime(df[dcol], errors="coerce")
-    min_d = pd.to_datetime(df[dcol].min())
-    max_d = pd.to_datetime(df[dcol].max())
+    _, datas, n_validas = _sorted_time_index(df, dcol, version)
+    min_d = pd.Timestamp(datas[0]) if n_validas else pd.NaT
+    max_d = pd.Timestamp(datas[n_validas - 1]) if n_validas else pd.NaT
 
     with st.expander("⏱️ Filtros de tempo", expanded=False):
         c1, c2 = st.columns(2)
@@ -287,17 +1039,13 @@ def add_time_widgets(df, dcol, key_suffix=""):
         )
         freq = st.radio(
             "Agregação", 
-            ["Mês", "Semana", "Dia"], 
+            list(FREQS_TEMPO), 
             horizontal=True, 
             index=0,
             key=f"freq_radio_{key_suffix}"
         )
-    
-    if start and end:
-        mask = (df[dcol] >= pd.to_datetime(start)) & (df[dcol] <= pd.to_datetime(end) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1))
-        df = df.loc[mask]
-
-    return df, {"Mês":"M", "Semana":"W-MON", "Dia":"D"}[freq]
+    freq = FREQS_TEMPO[freq]
+    return _time_window(df, dcol, version, start, end, freq), freq
 
 def time_axes_enhance(fig):
     """
@@ -324,7 +1072,169 @@ def time_axes_enhance(fig):
     )
     return fig
 
+# ======== Redução de pontos das séries longas (downsampling) ========
+# Com agregação "Dia" e anos de histórico, um gráfico receberia milhares de
+# pontos, mais do que cabe na largura dele. O servidor não sabe a largura real
+# de cada gráfico, então usamos um teto fixo, MAX_PONTOS_GRAFICO (~1 ponto
+# por pixel de um gráfico na largura toda do layout "wide"):
+# - linhas/áreas: downsample_series escolhe os pontos com LTTB (mantém picos e
+#   vales); séries enormes passam antes por um filtro min-max, que é vetorizado;
+# - barras: bucket_series junta períodos vizinhos em barras mais largas
+#   (somando), porque tirar barras faria períodos sumirem do gráfico.
+# O "zoom" que volta a mostrar detalhe é o filtro De/Até de add_time_widgets:
+# com uma janela menor, sobram menos pontos e a redução nem entra.
+MAX_PONTOS_GRAFICO = 1400   # teto de pontos (ou barras) por trace
+MINMAX_FATOR = 4            # acima de 4x o limite, pré-filtra com min-max
+
+def _minmax_indices(y: np.ndarray, n_baldes: int) -> np.ndarray:
+    """Índices do menor e do maior valor de cada balde (mais o primeiro e o último)."""
+    n = len(y)
+    tamanho = -(-n // n_baldes)                  # baldes de mesmo tamanho (o último completa)
+    pad = n_baldes * tamanho - n
+    baixo = np.concatenate([np.where(np.isnan(y), np.inf, y), np.full(pad, np.inf)]).reshape(n_baldes, tamanho)
+    alto = np.concatenate([np.where(np.isnan(y), -np.inf, y), np.full(pad, -np.inf)]).reshape(n_baldes, tamanho)
+    base = np.arange(n_baldes) * tamanho
+    idx = np.concatenate([[0, n - 1], base + baixo.argmin(axis=1), base + alto.argmax(axis=1)])
+    return np.unique(idx[idx < n])
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_saida: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: escolhe 'n_saida' pontos que preservam o
+    desenho da linha. Em cada balde fica o ponto que forma o maior triângulo
+    com o ponto escolhido antes e com a média do balde seguinte.
+    """
+    n = len(x)
+    if n_saida >= n or n_saida < 3:
+        return np.arange(n)
+    y = np.nan_to_num(y)                         # vazio conta como 0 só para a escolha
+    bordas = np.linspace(1, n - 1, n_saida - 1).astype(np.int64)
+    escolhidos = np.empty(n_saida, dtype=np.int64)
+    escolhidos[0], escolhidos[-1] = 0, n - 1
+    a = 0
+    for i in range(n_saida - 2):
+        ini, fim = bordas[i], bordas[i + 1]
+        prox_fim = bordas[i + 2] if i + 2 < len(bordas) else n
+        mx, my = x[fim:prox_fim].mean(), y[fim:prox_fim].mean()
+        area = np.abs((x[a] - mx) * (y[ini:fim] - y[a]) - (x[a] - x[ini:fim]) * (my - y[a]))
+        a = ini + int(area.argmax())
+        escolhidos[i + 1] = a
+    return escolhidos
+
+def downsample_series(df, x: str, y: str, limite: int = MAX_PONTOS_GRAFICO):
+    """
+    Reduz uma série temporal de LINHA (df ordenado por 'x') a no máximo
+    'limite' pontos, escolhidos pelo desenho da coluna 'y'. As outras colunas
+    vêm das mesmas linhas. Calcule acumulados e médias móveis ANTES (na série
+    completa). Séries que já cabem voltam intactas. Para barras, use bucket_series.
+    """
+    if len(df) <= limite:
+        return df
+    xs = df[x].to_numpy()
+    xs = (xs.astype("datetime64[ns]").astype(np.int64) if np.issubdtype(xs.dtype, np.datetime64) else xs).astype(np.float64)
+    ys = df[y].to_numpy(dtype=np.float64, na_value=np.nan)
+    if len(ys) > MINMAX_FATOR * limite:
+        pre = _minmax_indices(ys, MINMAX_FATOR * limite // 2)
+        return df.iloc[pre[lttb_indices(xs[pre], ys[pre], limite)]]
+    return df.iloc[lttb_indices(xs, ys, limite)]
+
+def bucket_series(df, x: str, somas, limite: int = MAX_PONTOS_GRAFICO):
+    """
+    Para gráficos de BARRAS: junta períodos vizinhos (df ordenado por 'x') em
+    baldes de k períodos, até sobrarem no máximo 'limite' barras. As colunas
+    de 'somas' são somadas e cada barra fica no início do seu balde; nenhum
+    período some. Devolve só 'x' e 'somas': médias e acumulados vêm DEPOIS.
+    """
+    if len(df) <= limite:
+        return df
+    k = -(-len(df) // limite)
+    agg = {x: "first", **{c: "sum" for c in somas}}
+    return df.groupby(np.arange(len(df)) // k).agg(agg).reset_index(drop=True)
+
 # ---------------- Sistema de Gamificação ----------------
+class _DesembrulhaNumpy(ast.NodeTransformer):
+    """Troca cada np.str_(x) (ou np.int64(x), etc.) da árvore por x."""
+
+    def visit_Call(self, no):
+        self.generic_visit(no)
+        f = no.func
+        if (isinstance(f, ast.Attribute) and isinstance(f.value, ast.Name)
+                and f.value.id in ("np", "numpy") and len(no.args) == 1 and not no.keywords):
+            return no.args[0]
+        return no
+
+class EstadoGamificacao:
+    """
+    Estado de gamificação de um usuário, já em tipos prontos para usar:
+    quantos cupons ele usou em cada loja e quais tipos de cupom já usou.
+    Atualizar é O(1) e as conquistas leem contadores, sem percorrer listas.
+    Fica gravado como JSON nas colunas lojas_visitadas e tipos_usados.
+    """
+    __slots__ = ("lojas", "tipos", "max_por_loja")
+
+    def __init__(self, lojas=None, tipos=None):
+        self.lojas = dict(lojas or {})   # loja -> quantidade de cupons
+        self.tipos = set(tipos or ())
+        self.max_por_loja = max(self.lojas.values(), default=0)
+
+    @property
+    def num_lojas(self) -> int:
+        return len(self.lojas)
+
+    def registrar(self, loja, tipo):
+        """Conta mais um cupom na loja e guarda o tipo usado."""
+        if loja:
+            n = self.lojas.get(loja, 0) + 1
+            self.lojas[loja] = n
+            if n > self.max_por_loja:
+                self.max_por_loja = n
+        if tipo:
+            self.tipos.add(tipo)
+
+    def lojas_json(self) -> str:
+        return json.dumps(self.lojas, ensure_ascii=False, separators=(",", ":"))
+
+    def tipos_json(self) -> str:
+        return json.dumps(sorted(self.tipos), ensure_ascii=False, separators=(",", ":"))
+
+    @staticmethod
+    def _ler(texto):
+        """
+        Lê o JSON novo ou, para linhas antigas, o texto de lista do Python
+        (ex.: "['Loja (Centro)', np.str_('Cashback')]") sem usar eval().
+        Texto que não dá para ler levanta ValueError: devolver [] faria quem
+        grava o estado apagar as lojas e tipos de verdade do usuário.
+        """
+        if texto is None or (not isinstance(texto, str) and pd.isna(texto)):
+            return []
+        texto = str(texto).strip()
+        if not texto:
+            return []
+        try:
+            return json.loads(texto)
+        except ValueError:
+            pass
+        try:
+            return ast.literal_eval(_DesembrulhaNumpy().visit(ast.parse(texto, mode="eval")))
+        except (ValueError, TypeError, SyntaxError, RecursionError) as e:
+            raise ValueError(f"estado de gamificação ilegível: {texto[:80]!r}") from e
+
+    @classmethod
+    def from_usuario(cls, usuario: dict) -> "EstadoGamificacao":
+        """Monta o estado a partir da linha do usuário (formato novo ou antigo)."""
+        lojas = cls._ler(usuario.get("lojas_visitadas"))
+        if isinstance(lojas, dict):
+            contagem = {str(k): int(v) for k, v in lojas.items()}
+        else:  # formato antigo: lista de lojas (cada ocorrência conta um cupom)
+            contagem = {}
+            for loja in lojas:
+                contagem[str(loja)] = contagem.get(str(loja), 0) + 1
+        return cls(contagem, (str(t) for t in cls._ler(usuario.get("tipos_usados"))))
+
+    def gravar_em(self, usuario: dict):
+        """Escreve o estado de volta nas colunas do usuário."""
+        usuario["lojas_visitadas"] = self.lojas_json()
+        usuario["tipos_usados"] = self.tipos_json()
+
 class SistemaGamificacao:
     """
     Transforma o uso de cupons em um jogo divertido!
@@ -395,18 +1305,19 @@ class SistemaGamificacao:
         # Se não há próximo nível, chegamos ao topo!
         return 1.0, None
     
-    def verificar_conquistas(self, usuario_data, cupom_data):
+    def verificar_conquistas(self, usuario_data, cupom_data, estado=None):
         """
         Verifica se o usuário ganhou alguma conquista depois de usar um cupom.
         É como ganhar um troféu por alcançar certos marcos!
+        Se o EstadoGamificacao já estiver montado, passe-o para não reler as colunas.
         """
         conquistas_desbloqueadas = []  # Lista de conquistas novas
         
         # Pega os dados atualizados do usuário
         cupons_usados = usuario_data.get("cupons_usados", 0)
         total_economizado = usuario_data.get("total_economizado", 0)
-        lojas_visitadas = eval(usuario_data.get("lojas_visitadas", "[]"))
-        tipos_usados = eval(usuario_data.get("tipos_usados", "[]"))
+        if estado is None:
+            estado = EstadoGamificacao.from_usuario(usuario_data)
         
         # Verifica cada tipo de conquista possível:
         
@@ -423,15 +1334,15 @@ class SistemaGamificacao:
             conquistas_desbloqueadas.append("colecionador")
         
         # Explorou várias lojas diferentes
-        if len(set(lojas_visitadas)) >= 5 and not usuario_data.get("conquista_explorador", False):
+        if estado.num_lojas >= 5 and not usuario_data.get("conquista_explorador", False):
             conquistas_desbloqueadas.append("explorador")
         
         # Fiel a uma loja específica
-        if lojas_visitadas and max([lojas_visitadas.count(loja) for loja in set(lojas_visitadas)]) >= 5 and not usuario_data.get("conquista_fiel", False):
+        if estado.max_por_loja >= 5 and not usuario_data.get("conquista_fiel", False):
             conquistas_desbloqueadas.append("fiel")
         
         # Usou diferentes tipos de cupom
-        if len(set(tipos_usados)) >= 3 and not usuario_data.get("conquista_estrategista", False):
+        if len(estado.tipos) >= 3 and not usuario_data.get("conquista_estrategista", False):
             conquistas_desbloqueadas.append("estrategista")
         
         # Alcançou nível alto
@@ -445,6 +1356,37 @@ class SistemaGamificacao:
         
         return conquistas_desbloqueadas
 
+    def aplicar_cupons(self, usuario, cupons):
+        """
+        Aplica vários cupons de uma vez no usuário, tudo em memória.
+        Cupom a cupom atualiza economia, lojas, tipos, nível e conquistas, como se
+        tivessem sido registrados um por um. Devolve (usuario_atualizado, conquistas)
+        e quem chama grava o resultado uma única vez no final.
+        """
+        usuario = dict(usuario)
+        usuario["cupons_usados"] = int(usuario.get("cupons_usados") or 0)
+        usuario["total_economizado"] = float(usuario.get("total_economizado") or 0)
+        usuario["xp"] = int(usuario.get("xp") or 0)
+
+        # Monta o estado UMA vez; cada cupom só incrementa contadores
+        estado = EstadoGamificacao.from_usuario(usuario)
+
+        desbloqueadas = []
+        for cupom in cupons:
+            usuario["cupons_usados"] += 1
+            usuario["total_economizado"] += cupom.get("valor", 0) * 0.1  # 10% do valor
+            estado.registrar(cupom.get("loja", ""), cupom.get("tipo", ""))
+
+            # Conquistas são verificadas a cada cupom (ex.: "primeiro passo" só vale no 1º)
+            for conquista_id in self.verificar_conquistas(usuario, cupom, estado):
+                usuario[f"conquista_{conquista_id}"] = True
+                usuario["xp"] += self.conquistas[conquista_id]["xp"]
+                desbloqueadas.append(conquista_id)
+
+        usuario["nivel"], _ = self.calcular_nivel(usuario["cupons_usados"])
+        estado.gravar_em(usuario)
+        return usuario, desbloqueadas
+
 # Cria o sistema de gamificação para usarmos em toda a aplicação
 gamificacao = SistemaGamificacao()
 
@@ -538,6 +1480,80 @@ def style_fig(fig, y_fmt=None, x_fmt=None):
         
     return fig
 
+# ---------------- Cache de Figuras ----------------
+# Trocar de aba ou mexer num widget de outra página roda o script inteiro de novo.
+# As figuras de cada página ficam guardadas por (versão dos dados, página,
+# estado dos widgets): se nada disso mudou, nem a agregação nem o plotly rodam.
+FIGURAS_MAX_BYTES = 64 * 1024 * 1024   # teto do cache (tamanho estimado das figuras em JSON)
+
+@st.cache_resource(show_spinner=False)
+def _figure_cache():
+    """Figuras prontas, para todas as sessões (LRU com teto de memória)."""
+    return {"lock": threading.Lock(), "itens": OrderedDict(), "bytes": 0}
+
+def widget_state(*keys):
+    """Valores atuais dos widgets com essas keys (vai para a chave do cache)."""
+    return tuple((k, st.session_state.get(k)) for k in keys)
+
+def time_widget_state(key_suffix: str):
+    """Estado dos filtros de tempo criados por add_time_widgets(key_suffix=...)."""
+    return widget_state(f"start_date_{key_suffix}", f"end_date_{key_suffix}", f"freq_radio_{key_suffix}")
+
+# Medir o JSON de verdade custaria uma segunda serialização (o st.plotly_chart
+# já serializa ao desenhar), então o tamanho é estimado pelos arrays dos traces.
+BYTES_POR_VALOR = 12          # média de um número/data/texto curto no JSON
+BYTES_POR_FIGURA = 6 * 1024   # layout + template de uma figura
+CAMPOS_ARRAY_TRACE = ("x", "y", "z", "text", "hovertext", "customdata", "ids",
+                      "labels", "values", "parents", "lat", "lon", "r", "theta")
+
+def _tamanho_figura(fig) -> int:
+    """Estimativa dos bytes que a figura ocupa em JSON, sem serializá-la."""
+    valores = 0
+    for trace in fig.data:
+        for campo in CAMPOS_ARRAY_TRACE:
+            if campo in trace:
+                valor = trace[campo]
+                if valor is not None and not isinstance(valor, str) and hasattr(valor, "__len__"):
+                    valores += len(valor)
+    return BYTES_POR_FIGURA + valores * BYTES_POR_VALOR
+
+def _tamanho_figuras(figuras: dict) -> int:
+    """Bytes que as figuras ocupam (estimados pelo JSON; tabelas contam pela memória)."""
+    total = 0
+    for valor in figuras.values():
+        if isinstance(valor, pd.DataFrame):
+            total += int(valor.memory_usage(deep=True).sum())
+        elif valor is not None:
+            total += _tamanho_figura(valor)
+    return total
+
+def cached_figures(versao, pagina: str, estado, construir) -> dict:
+    """
+    Figuras de uma página: {nome: figura}. Se (versao, pagina, estado) já foi
+    visto, devolve as figuras guardadas; senão chama construir() e guarda.
+    Quando o total passa de FIGURAS_MAX_BYTES, saem as usadas há mais tempo.
+    As figuras são compartilhadas entre sessões: só passe para st.plotly_chart.
+    """
+    chave = (versao, pagina, hashlib.sha1(repr(estado).encode()).hexdigest())
+    cache = _figure_cache()
+    with cache["lock"]:
+        item = _lru_get(cache["itens"], chave)
+    if item is not None:
+        return item[0]
+
+    figuras = construir()
+    tamanho = _tamanho_figuras(figuras)
+    with cache["lock"]:
+        antigo = cache["itens"].pop(chave, None)
+        if antigo is not None:
+            cache["bytes"] -= antigo[1]
+        cache["itens"][chave] = (figuras, tamanho)
+        cache["bytes"] += tamanho
+        while cache["bytes"] > FIGURAS_MAX_BYTES and len(cache["itens"]) > 1:
+            _, (_, liberado) = cache["itens"].popitem(last=False)
+            cache["bytes"] -= liberado
+    return figuras
+
 # ---------------- Sistema de Login e Cadastro ----------------
 def hash_password(pwd: str) -> str:
     """
@@ -546,63 +1562,209 @@ def hash_password(pwd: str) -> str:
     """
     return hashlib.sha256(pwd.encode("utf-8")).hexdigest()
 
-@st.cache_data(show_spinner=False)
-def load_users() -> pd.DataFrame:
+# ---------------- Repositório de Usuários ----------------
+# Os usuários ficam num banco SQLite embutido (data/usuarios.db), com índice
+# pelo e-mail em minúsculas. Buscar, cadastrar ou atualizar um usuário mexe
+# só na linha dele, em vez de reler e regravar o CSV inteiro a cada cupom.
+USERS_DB_PATH = DATA / "usuarios.db"
+
+USER_COLUMNS = {
+    # coluna: (tipo no SQLite, valor padrão)
+    "nome": ("TEXT", ""),
+    "email": ("TEXT", ""),
+    "senha_hash": ("TEXT", ""),
+    "criado_em": ("TEXT", None),
+    "cupons_usados": ("INTEGER", 0),
+    "total_economizado": ("REAL", 0.0),
+    "xp": ("INTEGER", 0),
+    "nivel": ("INTEGER", 1),
+    "lojas_visitadas": ("TEXT", "{}"),
+    "tipos_usados": ("TEXT", "[]"),
+    "ultimo_cupom": ("TEXT", None),
+    "melhor_sequencia": ("INTEGER", 0),
+}
+for _key in gamificacao.conquistas.keys():
+    USER_COLUMNS[f"conquista_{_key}"] = ("INTEGER", False)
+
+class RepositorioUsuarios(ABC):
     """
-    Carrega a lista de usuários do arquivo CSV com cache.
-    Se o arquivo não existe, cria uma estrutura vazia.
+    Interface do armazenamento de usuários.
+    Para trocar o SQLite por outro banco, basta criar outra classe com estes
+    métodos e devolvê-la em get_user_repo().
     """
-    if not os.path.exists(USERS_PATH):
-        # Define todas as colunas que vamos precisar
-        colunas_base = ["nome","email","senha_hash","criado_em","cupons_usados"]
-        colunas_gamificacao = [
-            "total_economizado", "xp", "nivel", "lojas_visitadas", 
-            "tipos_usados", "ultimo_cupom", "melhor_sequencia"
-        ]
-        conquistas_cols = [f"conquista_{key}" for key in gamificacao.conquistas.keys()]
-        return pd.DataFrame(columns=colunas_base + colunas_gamificacao + conquistas_cols)
-    
-    try:
-        # Tenta carregar o arquivo existente
-        df = pd.read_csv(USERS_PATH)
-        
-        # Garante que todas as colunas de gamificação existam
-        colunas_gamificacao = [
-            "total_economizado", "xp", "nivel", "lojas_visitadas", 
-            "tipos_usados", "ultimo_cupom", "melhor_sequencia"
+
+    @abstractmethod
+    def buscar(self, email: str):
+        """Devolve o usuário (dict) com esse e-mail, ou None se não existir."""
+
+    def existe(self, email: str) -> bool:
+        """Diz se já existe alguém cadastrado com esse e-mail."""
+        return self.buscar(email) is not None
+
+    @abstractmethod
+    def salvar(self, usuario: dict):
+        """Cria ou atualiza (upsert) um único usuário."""
+
+    @abstractmethod
+    def listar(self) -> pd.DataFrame:
+        """Devolve todos os usuários como tabela (uso administrativo)."""
+
+class RepositorioUsuariosSQLite(RepositorioUsuarios):
+    """Usuários em SQLite, com chave primária no e-mail em minúsculas."""
+
+    def __init__(self, db_path: Path, csv_legado=None):
+        self.db_path = Path(db_path)
+        self._criar_tabela()
+        # Primeira execução: traz os usuários do antigo usuarios.csv
+        if csv_legado is not None and Path(csv_legado).exists() and self._vazio():
+            self.importar_csv(csv_legado)
+        self.migrar_gamificacao()
+
+    @contextlib.contextmanager
+    def _conectar(self):
+        """Abre uma conexão curta: confirma a transação e fecha ao sair do bloco."""
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _criar_tabela(self):
+        colunas = ", ".join(f'"{c}" {tipo}' for c, (tipo, _) in USER_COLUMNS.items())
+        with self._conectar() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")  # leituras não bloqueiam escritas
+            conn.execute(f"CREATE TABLE IF NOT EXISTS usuarios (email_key TEXT PRIMARY KEY, {colunas})")
+
+    def _vazio(self) -> bool:
+        with self._conectar() as conn:
+            return conn.execute("SELECT 1 FROM usuarios LIMIT 1").fetchone() is None
+
+    @staticmethod
+    def _para_sql(coluna, valor):
+        """Converte valores do pandas/numpy para tipos que o SQLite entende."""
+        if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+            return USER_COLUMNS[coluna][1]
+        if isinstance(valor, np.generic):
+            valor = valor.item()
+        if coluna.startswith("conquista_"):
+            return int(bool(valor))
+        return valor
+
+    @staticmethod
+    def _de_sql(row) -> dict:
+        usuario = {c: row[c] for c in USER_COLUMNS}
+        for c in USER_COLUMNS:
+            if c.startswith("conquista_"):
+                usuario[c] = bool(usuario[c])
+        return usuario
+
+    @staticmethod
+    def _chave(email) -> str:
+        """E-mail em minúsculas e sem espaços ("" se vier vazio ou NaN do pandas)."""
+        return email.strip().lower() if isinstance(email, str) else ""
+
+    def _upsert(self, conn, usuarios, sobrescrever=True):
+        colunas = list(USER_COLUMNS)
+        nomes = ", ".join(f'"{c}"' for c in colunas)
+        marcadores = ", ".join("?" for _ in range(len(colunas) + 1))
+        if sobrescrever:
+            conflito = "DO UPDATE SET " + ", ".join(f'"{c}"=excluded."{c}"' for c in colunas)
+        else:
+            conflito = "DO NOTHING"
+        sql = (f"INSERT INTO usuarios (email_key, {nomes}) VALUES ({marcadores}) "
+               f"ON CONFLICT(email_key) {conflito}")
+        linhas = [
+            [self._chave(u.get("email"))] + [self._para_sql(c, u.get(c)) for c in colunas]
+            for u in usuarios
         ]
-        for col in colunas_gamificacao:
-            if col not in df.columns:
-                if col in ["lojas_visitadas", "tipos_usados"]:
-                    df[col] = "[]"  # Lista vazia
-                else:
-                    df[col] = 0     # Zero como valor padrão
-        
-        # Garante que todas as colunas de conquistas existam
-        conquistas_cols = [f"conquista_{key}" for key in gamificacao.conquistas.keys()]
-        for col in conquistas_cols:
-            if col not in df.columns:
-                df[col] = False  # Ainda não conquistou
-                
-        return df
-    except Exception:
-        # Em caso de erro, retorna estrutura básica
-        return pd.DataFrame(columns=["nome","email","senha_hash","criado_em","cupons_usados"])
+        conn.executemany(sql, linhas)
+
+    def buscar(self, email: str):
+        with self._conectar() as conn:
+            row = conn.execute(
+                "SELECT * FROM usuarios WHERE email_key = ?", (self._chave(email),)
+            ).fetchone()
+        return self._de_sql(row) if row is not None else None
+
+    def salvar(self, usuario: dict):
+        with self._conectar() as conn:
+            self._upsert(conn, [usuario])
 
-def email_exists(df: pd.DataFrame, email: str) -> bool:
+    def listar(self) -> pd.DataFrame:
+        with self._conectar() as conn:
+            df = pd.read_sql_query("SELECT * FROM usuarios", conn)
+        return df.drop(columns=["email_key"])
+
+    def migrar_gamificacao(self) -> int:
+        """
+        Converte linhas antigas (listas gravadas como texto do Python) para o JSON
+        do EstadoGamificacao. Só toca nas linhas que ainda estão no formato antigo.
+        """
+        with self._conectar() as conn:
+            rows = conn.execute(
+                "SELECT email_key, lojas_visitadas, tipos_usados FROM usuarios "
+                "WHERE lojas_visitadas NOT LIKE '{%' OR tipos_usados LIKE '%''%'"
+            ).fetchall()
+            novos = []
+            for row in rows:
+                try:
+                    estado = EstadoGamificacao.from_usuario(dict(row))
+                except ValueError:
+                    # fica como está (nada é perdido) até alguém corrigir a linha
+                    log.warning("gamificação de %s não migrada", row["email_key"], exc_info=True)
+                    continue
+                novos.append((estado.lojas_json(), estado.tipos_json(), row["email_key"]))
+            conn.executemany(
+                "UPDATE usuarios SET lojas_visitadas = ?, tipos_usados = ? WHERE email_key = ?", novos
+            )
+        return len(novos)
+
+    def importar_csv(self, csv_path) -> int:
+        """
+        Importa (uma vez) os usuários de um usuarios.csv antigo.
+        Quem já está no banco não é sobrescrito e linhas sem e-mail são
+        ignoradas. Retorna quantos usuários foram importados.
+        """
+        try:
+            df = pd.read_csv(csv_path)
+        except Exception:
+            return 0
+        usuarios = [u for u in df.to_dict(orient="records") if self._chave(u.get("email"))]
+        with self._conectar() as conn:
+            self._upsert(conn, usuarios, sobrescrever=False)
+        return len(usuarios)
+
+@st.cache_resource(show_spinner=False)
+def get_user_repo() -> RepositorioUsuarios:
+    """Repositório de usuários compartilhado por todas as sessões."""
+    return RepositorioUsuariosSQLite(USERS_DB_PATH, csv_legado=USERS_PATH or DATA / "usuarios.csv")
+
+@st.cache_data(show_spinner=False, max_entries=1000)
+def _buscar_usuario_cached(email_key: str, version):
+    return get_user_repo().buscar(email_key)
+
+def buscar_usuario(email: str):
+    """
+    Busca um usuário com cache por e-mail.
+    O cache de cada usuário só é refeito quando ESSE usuário é gravado.
+    """
+    email_key = (email or "").strip().lower()
+    return _buscar_usuario_cached(email_key, cache_version("usuarios", email_key))
+
+def email_exists(email: str) -> bool:
     """
     Verifica se um email já está cadastrado.
     Evita que duas pessoas usem o mesmo email.
     """
-    return email.lower() in (df["email"].astype(str).str.lower().tolist() if not df.empty else [])
+    return get_user_repo().existe(email)
 
 def save_user(nome: str, email: str, pwd: str):
     """
     Salva um novo usuário no sistema.
     Como adicionar uma nova ficha no nosso cadastro.
     """
-    df = load_users()
-    
     # Prepara todos os dados do novo usuário
     new_data = {
         "nome": (nome or "").strip(),
@@ -613,7 +1775,7 @@ def save_user(nome: str, email: str, pwd: str):
         "total_economizado": 0.0,
         "xp": 0,
         "nivel": 1,
-        "lojas_visitadas": "[]",
+        "lojas_visitadas": "{}",
         "tipos_usados": "[]",
         "ultimo_cupom": None,
         "melhor_sequencia": 0
@@ -623,28 +1785,22 @@ def save_user(nome: str, email: str, pwd: str):
     for key in gamificacao.conquistas.keys():
         new_data[f"conquista_{key}"] = False
         
-    # Adiciona o novo usuário à tabela
-    new = pd.DataFrame([new_data])
-    df = pd.concat([df, new], ignore_index=True)
-    df.to_csv(USERS_PATH, index=False, encoding="utf-8")
-    st.cache_data.clear()  # Limpa o cache para refletir as mudanças
+    # Grava só a linha do novo usuário
+    get_user_repo().salvar(new_data)
+    invalidate_cache("usuarios", new_data["email"])
 
 def check_login(email: str, pwd: str) -> bool:
     """
     Verifica se o email e senha estão corretos.
     Como um porteiro que verifica sua identidade.
     """
-    df = load_users()
-    if df.empty: 
-        return False  # Não há usuários cadastrados
-    
     # Procura o usuário pelo email
-    row = df[df["email"].astype(str).str.lower() == (email or "").lower()]
-    if row.empty: 
+    usuario = get_user_repo().buscar(email)
+    if usuario is None: 
         return False  # Email não encontrado
     
     # Verifica se a senha hasheada confere
-    password_correct = row.iloc[0]["senha_hash"] == hash_password(pwd or "")
+    password_correct = usuario["senha_hash"] == hash_password(pwd or "")
     
     if password_correct:
         # Salva o estado de login
@@ -657,59 +1813,125 @@ def atualizar_usuario_gamificacao(email: str, cupom_data: dict):
     Atualiza os dados do usuário depois que ele usa um cupom.
     Atualiza nível, conquistas, economia total, etc.
     """
-    df = load_users()
-    if df.empty: 
-        return []  # Não há usuários
-    
-    # Encontra o usuário pelo email
-    user_idx = df[df["email"] == email].index
-    if len(user_idx) == 0: 
+    return atualizar_usuario_gamificacao_lote(email, [cupom_data])
+
+def atualizar_usuario_gamificacao_lote(email: str, cupons: list):
+    """
+    Registra vários cupons de um usuário de uma vez só.
+    Lê o usuário uma vez, calcula tudo em memória e grava uma única vez no final.
+    Retorna as conquistas desbloqueadas (na ordem em que aconteceram).
+    """
+    repo = get_user_repo()
+    usuario = repo.buscar(email)
+    if usuario is None: 
         return []  # Usuário não encontrado
-    
-    idx = user_idx[0]
-    usuario = df.loc[idx].to_dict()
-    
-    # Atualiza contador de cupons usados
-    df.at[idx, "cupons_usados"] = usuario.get("cupons_usados", 0) + 1
-    
-    # Calcula economia (10% do valor do cupom) e soma ao total
-    economia = cupom_data.get("valor", 0) * 0.1
-    df.at[idx, "total_economizado"] = usuario.get("total_economizado", 0) + economia
-    
-    # Adiciona a loja à lista de lojas visitadas (se for nova)
-    loja = cupom_data.get("loja", "")
-    lojas_visitadas = eval(usuario.get("lojas_visitadas", "[]"))
-    if loja and loja not in lojas_visitadas:
-        lojas_visitadas.append(loja)
-        df.at[idx, "lojas_visitadas"] = str(lojas_visitadas)
-    
-    # Adiciona o tipo de cupom à lista de tipos usados (se for novo)
-    tipo = cupom_data.get("tipo", "")
-    tipos_usados = eval(usuario.get("tipos_usados", "[]"))
-    if tipo and tipo not in tipos_usados:
-        tipos_usados.append(tipo)
-        df.at[idx, "tipos_usados"] = str(tipos_usados)
-    
-    # Recalcula o nível atual
-    cupons_usados = df.at[idx, "cupons_usados"]
-    nivel_id, nivel_info = gamificacao.calcular_nivel(cupons_usados)
-    df.at[idx, "nivel"] = nivel_id
-    
-    # Verifica se desbloqueou alguma conquista
-    usuario_atualizado = df.loc[idx].to_dict()
-    conquistas = gamificacao.verificar_conquistas(usuario_atualizado, cupom_data)
-    
-    # Marca as conquistas desbloqueadas e adiciona XP
-    for conquista_id in conquistas:
-        df.at[idx, f"conquista_{conquista_id}"] = True
-        xp_conquista = gamificacao.conquistas[conquista_id]["xp"]
-        df.at[idx, "xp"] = usuario_atualizado.get("xp", 0) + xp_conquista
-    
-    # Salva todas as mudanças
-    df.to_csv(USERS_PATH, index=False, encoding="utf-8")
-    st.cache_data.clear()  # Limpa o cache para refletir as mudanças
+    if not cupons:
+        return []
+
+    try:
+        usuario, conquistas = gamificacao.aplicar_cupons(usuario, cupons)
+    except ValueError:
+        # estado antigo ilegível: não grava nada por cima das lojas/tipos do usuário
+        log.error("gamificação de %s não atualizada", email, exc_info=True)
+        return []
+
+    # Salva só a linha deste usuário
+    repo.salvar(usuario)
+    invalidate_cache("usuarios", email)
     return conquistas
 
+# ---------------- Histórico de Usos de Cupom (log só de acréscimo) ----------------
+# Cada cupom registrado vira UMA linha acrescentada no fim do cupom_usos.csv
+# (custo constante, não importa o tamanho do histórico). Um índice em memória
+# guarda, para cada e-mail, a posição (em bytes) das linhas dele no arquivo,
+# então o histórico de um usuário lê só as linhas desse usuário.
+USOS_COLUMNS = ["email", "data", "loja", "tipo", "valor", "local"]
+
+class RegistroUsosCupom:
+    """Log de usos de cupom em CSV, com escrita por acréscimo e índice por e-mail."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._colunas = None     # cabeçalho do arquivo
+        self._offsets = {}       # email (minúsculo) -> posições das linhas dele
+        self._indexado_ate = 0   # quantos bytes do arquivo já estão no índice
+
+    def _garantir_arquivo(self):
+        """Cria o arquivo com cabeçalho, ou garante que ele termina com quebra de linha."""
+        if not self.path.exists() or self.path.stat().st_size == 0:
+            with open(self.path, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerow(USOS_COLUMNS)
+            return
+        with open(self.path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    def _atualizar_indice(self):
+        """Indexa apenas o trecho do arquivo que apareceu desde a última leitura."""
+        if not self.path.exists():
+            return
+        tamanho = self.path.stat().st_size
+        if tamanho < self._indexado_ate:
+            # Arquivo foi trocado ou truncado: recomeça o índice do zero
+            self._colunas, self._offsets, self._indexado_ate = None, {}, 0
+        if tamanho == self._indexado_ate:
+            return
+
+        with open(self.path, "rb") as f:
+            f.seek(self._indexado_ate)
+            if self._colunas is None:
+                self._colunas = next(csv.reader([f.readline().decode("utf-8-sig")]), USOS_COLUMNS)
+            pos_email = self._colunas.index("email") if "email" in self._colunas else 0
+            while True:
+                pos = f.tell()
+                linha = f.readline()
+                if not linha.endswith(b"\n"):
+                    break  # fim do arquivo (ou linha ainda sendo escrita por outro processo)
+                campos = next(csv.reader([linha.decode("utf-8")]), [])
+                if len(campos) > pos_email:
+                    self._offsets.setdefault(campos[pos_email].strip().lower(), []).append(pos)
+            self._indexado_ate = pos
+
+    def registrar(self, uso: dict):
+        """Acrescenta um uso de cupom ao fim do arquivo (O(1))."""
+        with self._lock:
+            self._garantir_arquivo()
+            self._atualizar_indice()
+            valores = [str(uso.get(c, "") if uso.get(c) is not None else "").replace("\n", " ")
+                       for c in self._colunas]
+            buffer = io.StringIO()
+            csv.writer(buffer, lineterminator="\n").writerow(valores)
+            with open(self.path, "ab") as f:
+                f.write(buffer.getvalue().encode("utf-8"))
+            self._atualizar_indice()
+        invalidate_cache("cupom_usos")
+
+    def historico(self, email: str) -> pd.DataFrame:
+        """Devolve só as linhas do usuário, lidas direto das posições indexadas."""
+        with self._lock:
+            self._atualizar_indice()
+            colunas = self._colunas or USOS_COLUMNS
+            offsets = list(self._offsets.get((email or "").strip().lower(), []))
+
+        linhas = []
+        if offsets:
+            with open(self.path, "rb") as f:
+                for pos in offsets:
+                    f.seek(pos)
+                    linhas.append(next(csv.reader([f.readline().decode("utf-8")]), []))
+
+        hist = pd.DataFrame([l[:len(colunas)] for l in linhas], columns=colunas)
+        if "valor" in hist.columns:
+            hist["valor"] = pd.to_numeric(hist["valor"], errors="coerce")
+        return hist
+
+@st.cache_resource(show_spinner=False)
+def get_usos_log() -> RegistroUsosCupom:
+    """Log de usos de cupom compartilhado por todas as sessões."""
+    return RegistroUsosCupom(CUPOM_USOS_PATH or DATA / "cupom_usos.csv")
+
 # ---------------- Carregamento de Dados com Cache ---------------
 @st.cache_data(show_spinner=False)
 def load_xlsx_cached(path):
@@ -732,33 +1954,519 @@ def load_csv_cached(path):
     except Exception:
         return pd.DataFrame()
 
-def normcols(df: pd.DataFrame):
+class ResolvedorColunas:
     """
-    Normaliza os nomes das colunas para facilitar nosso trabalho.
-    Assim não importa se a coluna se chama "Data", "data" ou "DATA" - encontramos ela!
+    Sabe achar colunas por vários nomes possíveis num conjunto FIXO de colunas.
+    Cada pergunta (ex.: get("data", "date")) é respondida uma vez e guardada,
+    então as próximas buscas com os mesmos nomes são só uma consulta no dicionário.
     """
-    df = df.copy()
-    # Remove espaços extras dos nomes das colunas
-    df.columns = [str(c).strip() for c in df.columns]
-    
-    # Cria um dicionário com versões minúsculas para facilitar busca
-    lower = {c.lower(): c for c in df.columns}
-    
-    def get(*names):
+    __slots__ = ("renomear", "lower", "_respostas")
+
+    def __init__(self, colunas):
+        limpas = [str(c).strip() for c in colunas]
+        # Só as colunas que mudam de nome ao tirar espaços extras
+        self.renomear = {orig: limpa for orig, limpa in zip(colunas, limpas) if orig != limpa}
+        # Versões minúsculas para facilitar busca
+        self.lower = {c.lower(): c for c in limpas}
+        self._respostas = {}
+
+    def get(self, *names):
         """
         Procura uma coluna por vários nomes possíveis.
         Exemplo: get("data", "date", "data_captura") - acha qualquer um desses
         """
+        if names in self._respostas:
+            return self._respostas[names]
+        achou = None
         for n in names:
-            if n in lower: 
-                return lower[n]  # Encontrou exato
-        for want in names:
-            for lc, orig in lower.items():
-                if want in lc: 
-                    return orig  # Encontrou parecido
-        return None  # Não encontrou
-        
-    return df, get
+            if n in self.lower:
+                achou = self.lower[n]  # Encontrou exato
+                break
+        else:
+            for want in names:
+                achou = next((orig for lc, orig in self.lower.items() if want in lc), None)
+                if achou is not None:
+                    break  # Encontrou parecido
+        self._respostas[names] = achou
+        return achou
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def _resolvedor_colunas(colunas: tuple) -> ResolvedorColunas:
+    """Um resolvedor por "impressão digital" (a lista de nomes) das colunas."""
+    return ResolvedorColunas(colunas)
+
+def normcols(df: pd.DataFrame):
+    """
+    Normaliza os nomes das colunas para facilitar nosso trabalho.
+    Assim não importa se a coluna se chama "Data", "data" ou "DATA" - encontramos ela!
+    Os dados NÃO são copiados: se algum nome tem espaços extras, só os nomes
+    são trocados (o df devolvido compartilha os dados; use só para leitura).
+    A resolução dos nomes fica em cache para cada conjunto de colunas.
+    """
+    colunas = tuple(df.columns)
+    resolvedor = _resolvedor_colunas(colunas) if _em_sessao() else ResolvedorColunas(colunas)
+    if resolvedor.renomear:
+        df = df.rename(columns=resolvedor.renomear, copy=False)
+    return df, resolvedor.get
+
+# ---------------- Cubo de Agregados das Transações ----------------
+# Em vez de cada página agrupar as transações linha a linha a cada clique,
+# calculamos UMA vez (por versão dos dados) um "cubo" diário com somas e
+# contagens por loja × tipo de cupom × categoria × hora × dia da semana.
+# Todos os gráficos do painel são respondidos a partir dele.
+CUBE_DIMENSIONS = ["dia", "loja", "tipo", "categoria", "hora", "dia_semana"]
+
+DIAS_SEMANA_PT = {0: "Segunda", 1: "Terça", 2: "Quarta", 3: "Quinta", 4: "Sexta", 5: "Sábado", 6: "Domingo"}
+
+def _cube_columns(get):
+    """Descobre quais colunas do arquivo alimentam cada dimensão e cada medida do cubo."""
+    colunas = {
+        "data": get("data", "data_captura"),
+        "loja": get("nome_estabelecimento", "nome_loja", "loja"),
+        "tipo": get("tipo_cupom", "tipo"),
+        "categoria": get("categoria_estabelecimento", "categoria_loja"),
+    }
+    medidas = {
+        "valor": get("valor_compra", "valor"),                      # receita (Home, KPIs, Financeiro)
+        "valor_cupom": get("valor_cupom", "valor_compra", "valor"),  # Análise de Tendências
+        "custo": get("custo_venda", "custo"),
+        "lucro": get("lucro_bruto", "lucro"),
+    }
+    return colunas, medidas
+
+def build_transaction_cube(tx: pd.DataFrame):
+    """
+    Monta o cubo diário a partir das transações.
+    Para cada medida m guarda m_soma (soma) e m_n (quantos valores não vazios);
+    a média é m_soma / m_n. A coluna "n" conta as transações de cada célula.
+    Retorna (cubo, meta), onde meta diz de quais colunas originais veio cada coisa.
+    """
+    df, get = normcols(tx)
+    colunas, medidas = _cube_columns(get)
+    medidas = {m: c for m, c in medidas.items() if c}
+
+    if colunas["data"]:
+        datas = pd.to_datetime(df[colunas["data"]], errors="coerce")
+    else:
+        datas = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+
+    base = pd.DataFrame({
+        "dia": datas.dt.normalize(),
+        "loja": df[colunas["loja"]] if colunas["loja"] else pd.Series(np.nan, index=df.index, dtype="object"),
+        "tipo": df[colunas["tipo"]] if colunas["tipo"] else pd.Series(np.nan, index=df.index, dtype="object"),
+        "categoria": df[colunas["categoria"]] if colunas["categoria"] else pd.Series(np.nan, index=df.index, dtype="object"),
+        "hora": datas.dt.hour,
+        "dia_semana": datas.dt.weekday,
+    }, index=df.index)
+    for m, c in medidas.items():
+        # somas sempre em float64, mesmo se a coluna foi guardada como float32
+        v = pd.to_numeric(df[c], errors="coerce").astype("float64")
+        base[f"{m}_soma"] = v.fillna(0.0)
+        base[f"{m}_n"] = v.notna().astype("int64")
+    base["n"] = 1
+
+    cubo = (base.groupby(CUBE_DIMENSIONS, dropna=False, sort=True, observed=True)
+                .sum()
+                .reset_index())
+    # Colunas "category" viram texto comum no cubo (ele é pequeno e é concatenado
+    # com outros cubos depois)
+    for c in ("loja", "tipo", "categoria"):
+        if isinstance(cubo[c].dtype, pd.CategoricalDtype):
+            cubo[c] = cubo[c].astype(object)
+    meta = {
+        "colunas": colunas,
+        "medidas": medidas,
+        "linhas": len(df),
+        "colunas_originais": list(df.columns),
+    }
+    if medidas.get("valor") and colunas["loja"]:
+        meta["top_lojas"] = top_lojas_resumo(cubo)
+    if medidas.get("valor_cupom") and colunas["loja"] and colunas["tipo"]:
+        # amostra estável para o box plot (valores individuais, não cabem no cubo)
+        meta["amostra"] = sample_transactions(datas, df[colunas["loja"]], df[colunas["tipo"]],
+                                              df[medidas["valor_cupom"]])
+    return cubo, meta
+
+def merge_cubes(base: pd.DataFrame, delta: pd.DataFrame) -> pd.DataFrame:
+    """
+    Soma um cubo "delta" (transações novas) no cubo base.
+    Só os dias que aparecem no delta são reagrupados; o resto fica como está.
+    """
+    if base.empty:
+        return delta
+    afetados = base["dia"].isin(delta["dia"].unique())
+    refeitos = (pd.concat([base[afetados], delta], ignore_index=True)
+                  .groupby(CUBE_DIMENSIONS, dropna=False, sort=False)
+                  .sum()
+                  .reset_index())
+    refeitos = refeitos.sort_values("dia", kind="stable", na_position="last")
+    cubo = pd.concat([base[~afetados], refeitos], ignore_index=True)
+    # Transações novas quase sempre são as mais recentes: só reordena se precisar
+    if not cubo["dia"].dropna().is_monotonic_increasing:
+        cubo = cubo.sort_values("dia", kind="stable", na_position="last", ignore_index=True)
+    return cubo
+
+# === Resumo das lojas que mais faturam (Space-Saving) ===
+# O ranking "Top N lojas por Receita" do CFO agrupava o cubo inteiro por loja
+# a cada mudança de filtro, e com centenas de milhares de lojas isso domina a
+# página. Na ingestão guardamos em meta["top_lojas"] as TOP_LOJAS_CAPACIDADE
+# lojas de maior receita com totais EXATOS (receita e transações) e "resto",
+# um teto para a receita de qualquer loja que ficou de fora. Se a N-ésima loja
+# do resumo fatura mais que o resto, as N primeiras são o top N de verdade e a
+# consulta nem toca no cubo.
+# Ao somar um lote novo (merge_top_lojas), uma loja que só um dos lados
+# conhecia pode ter receita escondida no "resto" do outro; só essas são
+# conferidas no cubo (filtro pelas lojas candidatas, sem agrupar tudo).
+TOP_LOJAS_CAPACIDADE = 1024
+
+def _resumo_de_totais(totais: pd.DataFrame, resto: float, celulas: int,
+                      capacidade: int) -> dict:
+    """Corta os totais exatos (índice loja, colunas receita/transacoes) na capacidade."""
+    totais = totais.sort_values("receita", ascending=False, kind="stable")
+    completo = len(totais) <= capacidade
+    if not completo:
+        resto = max(resto, float(totais["receita"].iloc[capacidade]))
+        totais = totais.iloc[:capacidade]
+    return {
+        "lojas": totais.index.tolist(),
+        "receita": totais["receita"].astype("float64").tolist(),
+        "transacoes": totais["transacoes"].astype("int64").tolist(),
+        "resto": float(resto),
+        "completo": completo,
+        "celulas": celulas,
+    }
+
+def _totais_por_loja(cubo: pd.DataFrame, lojas=None) -> pd.DataFrame:
+    """Receita e transações exatas por loja (só células com data, como no recorte de tempo)."""
+    linhas = cubo["dia"].notna() & cubo["loja"].notna()
+    if lojas is not None:
+        linhas &= cubo["loja"].isin(lojas)
+    totais = (cubo.loc[linhas, ["loja", "valor_soma", "valor_n"]]
+                  .groupby("loja", sort=True)
+                  .sum())
+    return totais.rename(columns={"valor_soma": "receita", "valor_n": "transacoes"})
+
+def top_lojas_resumo(cubo: pd.DataFrame, capacidade: int = TOP_LOJAS_CAPACIDADE) -> dict:
+    """Resumo das lojas de maior receita de um cubo (feito na ingestão de cada lote)."""
+    return _resumo_de_totais(_totais_por_loja(cubo), 0.0,
+                             int(cubo["dia"].notna().sum()), capacidade)
+
+def _totais_do_resumo(resumo: dict) -> pd.DataFrame:
+    return pd.DataFrame({"receita": resumo["receita"], "transacoes": resumo["transacoes"]},
+                        index=pd.Index(resumo["lojas"], name="loja"))
+
+def merge_top_lojas(a: dict, b: dict, cubo: pd.DataFrame,
+                    capacidade: int = TOP_LOJAS_CAPACIDADE) -> dict:
+    """
+    Junta os resumos de duas partes das transações; 'cubo' é o cubo já somado.
+    Loja presente nos dois: soma exata. Loja que só um lado conhece é exata se
+    o outro lado estava completo; senão o total dela é conferido no cubo.
+    """
+    ta, tb = _totais_do_resumo(a), _totais_do_resumo(b)
+    totais = ta.add(tb, fill_value=0)
+    incertas = []
+    if not b["completo"]:
+        incertas.extend(ta.index.difference(tb.index))
+    if not a["completo"]:
+        incertas.extend(tb.index.difference(ta.index))
+    if incertas:
+        totais.loc[incertas] = _totais_por_loja(cubo, incertas).reindex(incertas, fill_value=0).to_numpy()
+    return _resumo_de_totais(totais, a["resto"] + b["resto"],
+                             int(cubo["dia"].notna().sum()), capacidade)
+
+def top_lojas(resumo, n: int, celulas: int):
+    """
+    As n lojas de maior receita direto do resumo (loja, Receita, Transacoes,
+    em ordem de loja), ou None se o resumo não garante a resposta: recorte de
+    tempo que não cobre todas as células do cubo ('celulas' = linhas do
+    recorte) ou uma loja fora do resumo que poderia entrar no top n.
+    """
+    if resumo is None or celulas != resumo["celulas"]:
+        return None
+    receita = resumo["receita"]
+    if not resumo["completo"] and (len(receita) < n or receita[n - 1] <= resumo["resto"]):
+        return None
+    top = pd.DataFrame({
+        "loja": resumo["lojas"][:n],
+        "Receita": np.asarray(receita[:n], dtype=np.float64),
+        "Transacoes": np.asarray(resumo["transacoes"][:n], dtype=np.int64),
+    })
+    return top.sort_values("loja", ignore_index=True)
+
+# === Amostra estável para as distribuições (box plot) ===
+# Para cada (loja, tipo de cupom) guardamos as AMOSTRA_POR_GRUPO transações de
+# menor "prioridade", e a prioridade é um hash do conteúdo da linha. Assim a
+# amostra é sempre a mesma para os mesmos dados (o gráfico não pula a cada
+# rerun) e amostras de pedaços diferentes se juntam sem reler nada.
+# Vale para todas as lojas (o tamanho cresce com o número de pares loja × tipo)
+# e fica em meta["amostra"], gravada junto com o cubo (cubo.<arquivo>.*.amostra.parquet).
+AMOSTRA_POR_GRUPO = 50
+
+def _amostra_por_grupo(amostra: pd.DataFrame) -> pd.DataFrame:
+    """Mantém as AMOSTRA_POR_GRUPO de menor prioridade de cada (loja, tipo)."""
+    amostra = amostra.sort_values("prioridade", kind="stable")
+    amostra = amostra.groupby(["loja", "tipo"], sort=False).head(AMOSTRA_POR_GRUPO)
+    return amostra.sort_values(["loja", "tipo", "prioridade"], kind="stable", ignore_index=True)
+
+def sample_transactions(datas, lojas, tipos, valores) -> pd.DataFrame:
+    """Amostra estratificada (loja, tipo, valor, prioridade) de um lote de transações."""
+    linhas = pd.DataFrame({
+        "dia": pd.to_datetime(datas, errors="coerce"),
+        "loja": pd.Series(lojas).astype(object).to_numpy(),
+        "tipo": pd.Series(tipos).astype(object).to_numpy(),
+        "valor": pd.to_numeric(valores, errors="coerce").astype("float64").to_numpy(),
+    }).dropna(subset=["loja", "tipo", "valor"])
+    linhas["prioridade"] = pd.util.hash_pandas_object(linhas, index=False).to_numpy()
+    return _amostra_por_grupo(linhas.drop(columns="dia"))
+
+def merge_samples(a: pd.DataFrame, b: pd.DataFrame) -> pd.DataFrame:
+    """Junta duas amostras (de pedaços diferentes das transações)."""
+    return _amostra_por_grupo(pd.concat([a, b], ignore_index=True))
+
+# === Cubo salvo em disco + "marca d'água" (última data já agregada) ===
+# Quando chega um transacoes.xlsx novo com mais linhas no fim, só as linhas
+# com data_captura depois da marca d'água são agregadas e somadas ao cubo.
+# O estado é de UM arquivo de origem (cubo.<arquivo>.json) e guarda a
+# impressão digital das linhas já agregadas: se alguma linha antiga mudar,
+# o cubo é refeito. O JSON é gravado por último e aponta para os Parquet
+# daquela gravação, então quem lê nunca vê cubo e metadados misturados.
+def _cube_state_json(fonte: Path) -> Path:
+    return CACHE_DIR / f"cubo.{fonte.name}.json"
+
+def _impressao_linhas(df: pd.DataFrame, colunas) -> np.ndarray:
+    """Hash (uint64) de cada linha, só nas colunas que entram no cubo."""
+    return pd.util.hash_pandas_object(df[colunas], index=False).to_numpy()
+
+def _soma_hashes(hashes: np.ndarray) -> str:
+    """Impressão digital de um conjunto de linhas (não depende da ordem delas)."""
+    return format(int(hashes.sum(dtype=np.uint64)), "016x")
+
+def _load_cube_state(fonte: Path):
+    """Lê o cubo salvo e seus metadados (ou None se não houver/estiver inválido)."""
+    caminho = _cube_state_json(fonte)
+    if not caminho.exists():
+        return None
+    try:
+        info = json.loads(caminho.read_text(encoding="utf-8"))
+        cubo = pd.read_parquet(CACHE_DIR / info["cubo"])
+        meta = info["meta"]
+        if info.get("amostra"):
+            meta["amostra"] = pd.read_parquet(CACHE_DIR / info["amostra"])
+        return cubo, meta, pd.Timestamp(info["marca_dagua"])
+    except Exception:
+        log.warning("estado do cubo em %s ilegível; o cubo será refeito", caminho.name, exc_info=True)
+        return None
+
+def _save_cube_state(fonte: Path, cubo: pd.DataFrame, meta: dict, marca_dagua):
+    """Grava cubo + metadados (se não der, o cubo só não fica salvo)."""
+    if pd.isna(marca_dagua):
+        return
+    caminho = _cube_state_json(fonte)
+    prefixo = f"cubo.{fonte.name}.{os.getpid()}.{threading.get_ident()}.{time.time_ns()}"
+    arquivos = {"cubo": f"{prefixo}.parquet"}
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        cubo.to_parquet(CACHE_DIR / arquivos["cubo"], index=False)
+        amostra = meta.get("amostra")
+        if amostra is not None:
+            arquivos["amostra"] = f"{prefixo}.amostra.parquet"
+            amostra.to_parquet(CACHE_DIR / arquivos["amostra"], index=False)
+        meta = {k: v for k, v in meta.items() if k != "amostra"}
+        tmp = caminho.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(dict(arquivos, meta=meta,
+                                       marca_dagua=pd.Timestamp(marca_dagua).isoformat())),
+                       encoding="utf-8")
+        os.replace(tmp, caminho)  # a gravação "vale" só a partir daqui
+    except Exception:
+        log.warning("não deu para salvar o estado do cubo de %s", fonte.name, exc_info=True)
+        for nome in arquivos.values():
+            (CACHE_DIR / nome).unlink(missing_ok=True)
+        return
+    for old in CACHE_DIR.glob(f"cubo.{fonte.name}.*.parquet"):
+        if old.name not in arquivos.values():
+            old.unlink(missing_ok=True)
+
+def update_transaction_cube(tx: pd.DataFrame, fonte: Path = None):
+    """
+    Devolve o cubo das transações reaproveitando o que já foi agregado antes
+    para o arquivo 'fonte' (sem fonte, só agrega, sem salvar nada).
+    Se as linhas antigas continuam iguais (mesmas colunas, mesma quantidade e
+    mesma impressão digital até a marca d'água), agrega só as linhas novas e
+    atualiza só os dias afetados. Se algo no histórico mudou, refaz o cubo inteiro.
+    """
+    df, get = normcols(tx)
+    colunas, medidas = _cube_columns(get)
+    medidas = {m: c for m, c in medidas.items() if c}
+    datas = pd.to_datetime(df[colunas["data"]], errors="coerce") if colunas["data"] else None
+    if fonte is None or datas is None:
+        return build_transaction_cube(tx)
+    usadas = list(dict.fromkeys([c for c in colunas.values() if c] + list(medidas.values())))
+    hashes = _impressao_linhas(df, usadas)
+
+    estado = _load_cube_state(fonte)
+    if estado is not None:
+        cubo_salvo, meta_salva, marca = estado
+        novos = (datas > marca).to_numpy()
+        mesmo_esquema = meta_salva["colunas"] == colunas and meta_salva["medidas"] == medidas
+        if (mesmo_esquema and len(df) - int(novos.sum()) == meta_salva["linhas"]
+                and _soma_hashes(hashes[~novos]) == meta_salva.get("impressao")):
+            meta = dict(meta_salva, linhas=len(df), colunas_originais=list(df.columns),
+                        impressao=_soma_hashes(hashes))
+            if "amostra" not in meta and medidas.get("valor_cupom") and colunas["loja"] and colunas["tipo"]:
+                # cubo salvo antes da amostra existir: refeita das linhas antigas, uma vez
+                antigos = ~novos
+                meta["amostra"] = sample_transactions(datas[antigos], df.loc[antigos, colunas["loja"]],
+                                                      df.loc[antigos, colunas["tipo"]],
+                                                      df.loc[antigos, medidas["valor_cupom"]])
+            if "top_lojas" not in meta and medidas.get("valor") and colunas["loja"]:
+                # cubo salvo antes do resumo existir: feito do cubo salvo, uma vez
+                meta["top_lojas"] = top_lojas_resumo(cubo_salvo)
+            if not novos.any():
+                return cubo_salvo, meta
+            delta, meta_delta = build_transaction_cube(tx[novos])
+            cubo = merge_cubes(cubo_salvo, delta)
+            if "amostra" in meta and "amostra" in meta_delta:
+                meta["amostra"] = merge_samples(meta["amostra"], meta_delta["amostra"])
+            if "top_lojas" in meta and "top_lojas" in meta_delta:
+                meta["top_lojas"] = merge_top_lojas(meta["top_lojas"], meta_delta["top_lojas"], cubo)
+            _save_cube_state(fonte, cubo, meta, datas.max())
+            return cubo, meta
+
+    # Primeira vez (ou histórico alterado): agrega tudo
+    cubo, meta = build_transaction_cube(tx)
+    meta["impressao"] = _soma_hashes(hashes)
+    _save_cube_state(fonte, cubo, meta, datas.max())
+    return cubo, meta
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _transaction_cube_cached(fonte: str, version, tx_version=0):
+    if fonte == "transacoes":
+        pronto = _take_ready_generation("cubo_transacoes", version)
+        cubo, meta = pronto or update_transaction_cube(_load_dataset("transacoes")[2],
+                                                       _arquivo_do_dataset("transacoes"))
+    else:
+        # "exemplo:<linhas>"
+        tx = generate_example_data(num_rows=int(fonte.split(":", 1)[1]))
+        cubo, meta = build_transaction_cube(tx)
+    # Identifica esta versão do cubo (usado pelos filtros de tempo memorizados)
+    return cubo, dict(meta, versao=f"{fonte}@{version}")
+
+def get_transaction_cube(tx=None, example_rows=2500):
+    """
+    Cubo das transações reais (ou de dados de exemplo, se não houver transações).
+    Fica em cache até a versão de "transacoes" mudar; o cubo é compartilhado
+    entre as sessões e cada chamada recebe um snapshot dele.
+    'tx' é o dataset que a página já recebeu: pedir de novo repetiria na tela
+    o aviso de arquivo não encontrado (o cache reexibe o st.error do leitor).
+    """
+    if tx is None:
+        tx = get_dataset("transacoes")
+    csv_grande = _csv_grande(DATASETS["transacoes"]["arquivos"])
+    if tx.empty:
+        cubo, meta = _transaction_cube_cached(f"exemplo:{example_rows}", 0)
+    elif csv_grande is not None:
+        cubo, meta = get_streamed_transaction_cube(csv_grande)
+    else:
+        cubo, meta = _transaction_cube_cached("transacoes", cache_version("cubo_transacoes"),
+                                              cache_version("transacoes"))
+    return snapshot(cubo), dict(meta)
+
+# === Cubo montado em pedaços (CSV muito grande) ===
+def _csv_stream_plan(path: Path):
+    """
+    Lê só o cabeçalho do CSV e decide o que ler: apenas as colunas que o cubo
+    usa (usecols) e com tipos explícitos (textos repetidos como "category",
+    valores como float64).
+    """
+    cabecalho = list(pd.read_csv(path, nrows=0).columns)
+    _, get = normcols(pd.DataFrame(columns=cabecalho))
+    colunas, medidas = _cube_columns(get)
+    dimensoes = {c for k, c in colunas.items() if c and k != "data"}
+    valores = {c for c in medidas.values() if c} - dimensoes
+    usadas = dimensoes | valores | {colunas["data"]}
+    usecols = [c for c in cabecalho if str(c).strip() in usadas]
+    dtype = {c: "category" for c in usecols if str(c).strip() in dimensoes}
+    dtype.update({c: "float64" for c in usecols if str(c).strip() in valores})
+    return cabecalho, usecols, dtype
+
+def _stream_cube(path: Path, usecols, dtype, chunk_rows, progresso):
+    total = max(path.stat().st_size, 1)
+    cubo, meta, linhas = None, None, 0
+    with open(path, "rb") as f:
+        for chunk in pd.read_csv(f, usecols=usecols, dtype=dtype, chunksize=chunk_rows):
+            delta, meta_delta = build_transaction_cube(chunk)
+            if cubo is None:
+                cubo, meta = delta, meta_delta
+            else:
+                cubo = merge_cubes(cubo, delta)
+                juntos = dict(meta_delta)
+                if "amostra" in meta_delta:
+                    juntos["amostra"] = merge_samples(meta["amostra"], meta_delta["amostra"])
+                if "top_lojas" in meta_delta:
+                    juntos["top_lojas"] = merge_top_lojas(meta["top_lojas"], meta_delta["top_lojas"], cubo)
+                meta = juntos
+            linhas += len(chunk)
+            if progresso is not None:
+                progresso(min(f.tell() / total, 1.0), linhas)
+    if cubo is None:  # só cabeçalho
+        cubo, meta = build_transaction_cube(pd.read_csv(path, nrows=0, usecols=usecols))
+    return cubo, meta, linhas
+
+def stream_transaction_cube(path: Path, chunk_rows: int = CSV_CHUNK_ROWS, progresso=None):
+    """
+    Monta o cubo lendo o CSV em pedaços de 'chunk_rows' linhas: cada pedaço vira
+    um cubo pequeno que é somado ao total (merge_cubes) e depois descartado.
+    A amostra do box plot e o resumo das lojas de maior receita de cada pedaço
+    também são somados (merge_samples / merge_top_lojas), então valem para o
+    arquivo inteiro. A memória máxima depende do tamanho do pedaço, não do arquivo.
+    progresso(fração_lida, linhas_lidas) é chamado depois de cada pedaço.
+    """
+    cabecalho, usecols, dtype = _csv_stream_plan(path)
+    try:
+        cubo, meta, linhas = _stream_cube(path, usecols, dtype, chunk_rows, progresso)
+    except ValueError:
+        # Algum valor não é número: lê os valores como vierem (o cubo usa to_numeric)
+        log.info("%s: valores não numéricos, lendo sem float64 explícito", path.name)
+        dtype = {c: t for c, t in dtype.items() if t == "category"}
+        cubo, meta, linhas = _stream_cube(path, usecols, dtype, chunk_rows, progresso)
+    return cubo, dict(meta, linhas=linhas, colunas_originais=[str(c).strip() for c in cabecalho])
+
+@st.cache_resource(show_spinner=False)
+def _streamed_cubes():
+    """Cubos montados em pedaços (compartilhados entre sessões)."""
+    return {"lock": threading.Lock(), "cubos": OrderedDict()}
+
+def _streamed_cube_for(path: Path, chave, progresso=None):
+    """Cubo do CSV para a 'chave' (nome do arquivo, versão), montando se preciso."""
+    estado = _streamed_cubes()
+    with estado["lock"]:
+        if chave not in estado["cubos"]:
+            pronto = _take_ready_generation("cubo_transacoes", chave[1])
+            cubo, meta = pronto or stream_transaction_cube(path, progresso=progresso)
+            # guarda a geração atual e a nova (que pode estar sendo preparada)
+            _lru_put(estado["cubos"], chave, (cubo, dict(meta, versao=f"csv:{chave[0]}@{chave[1]}")), 2)
+        return estado["cubos"][chave]
+
+def get_streamed_transaction_cube(path: Path):
+    """
+    Cubo de um CSV grande, montado uma vez por versão de "cubo_transacoes"
+    (quem troca a versão quando o arquivo muda é a atualização em segundo
+    plano), com barra de progresso na tela. Sessões que chegam durante a leitura esperam o mesmo cubo.
+    """
+    barra = []
+    def progresso(fracao, linhas):
+        if not barra:
+            barra.append(st.progress(0.0))
+        barra[0].progress(fracao, text=f"Lendo {path.name}: {linhas:,} linhas".replace(",", "."))
+    cubo, meta = _streamed_cube_for(path, (path.name, cache_version("cubo_transacoes")), progresso)
+    if barra:
+        barra[0].empty()
+    # cópia do cubo (pequeno): as páginas podem acrescentar colunas nele
+    return cubo, meta
+
+def cube_periods(dias: pd.Series, freq: str) -> pd.Series:
+    """Converte a coluna 'dia' do cubo no início do período (mês/semana/dia)."""
+    return dias.dt.to_period(freq).dt.to_timestamp()
 
 # ---------------- Componentes Visuais da Interface ----------------
 def top_header():
@@ -775,11 +2483,10 @@ def top_header():
     with col2:
         # Informações do usuário logado
         user = st.session_state.get("user_email") or "Usuário"
-        df_users = load_users()
-        user_data = df_users[df_users["email"] == user]
+        user_data = buscar_usuario(user)
         
-        if not user_data.empty:
-            nivel_id = user_data["nivel"].iloc[0]
+        if user_data is not None:
+            nivel_id = user_data["nivel"]
             if nivel_id not in gamificacao.niveis:
                 nivel_id = 1  # Segurança
             nivel_info = gamificacao.niveis.get(nivel_id, gamificacao.niveis[1])
@@ -848,12 +2555,11 @@ def sidebar_nav():
     # Mostra informações do usuário logado
     email = st.session_state.get("user_email")
     if email:
-        df_users = load_users()
-        user_data = df_users[df_users["email"] == email]
+        user_data = buscar_usuario(email)
         
-        if not user_data.empty:
-            cupons_usados = user_data["cupons_usados"].iloc[0]
-            nivel_id = user_data["nivel"].iloc[0]
+        if user_data is not None:
+            cupons_usados = user_data["cupons_usados"]
+            nivel_id = user_data["nivel"]
             
             if nivel_id not in gamificacao.niveis:
                 nivel_id = 1
@@ -968,7 +2674,7 @@ def signup_screen():
                 st.warning("A senha deve ter pelo menos 6 caracteres.")
             elif pwd != pwd2:
                 st.warning("As senha não conferem.")
-            elif email_exists(load_users(), email):
+            elif email_exists(email):
                 st.error("Este e-mail já está cadastrado.")
             else:
                 # Tudo certo! Cria o usuário
@@ -978,87 +2684,113 @@ def signup_screen():
                 st.rerun()
 
 # ---------------- Páginas Principais do Sistema ----------------
-def generate_example_data(num_rows=2500):
+# === Dados de exemplo (sintéticos) ===
+# Tudo é gerado com operações vetorizadas do NumPy (sem laço por linha) e os
+# textos repetidos (loja, tipo, categoria) já saem como "category".
+EXEMPLO_DIAS = 540                                 # ~18 meses para trás
+EXEMPLO_PESOS_DIA = [0.9, 0.9, 1.0, 1.1, 1.4, 1.5, 1.2]  # Segunda a Domingo
+EXEMPLO_LOJAS = {
+    # loja: (probabilidade, categoria, valor médio, margem bruta)
+    'iFood':            (0.30, 'Alimentação', 70,  0.30),
+    'Mercado Livre':    (0.20, 'Marketplace', 180, 0.25),
+    'Amazon':           (0.15, 'Marketplace', 220, 0.20),
+    'Uber':             (0.10, 'Transporte',  30,  0.20),
+    'Magazine Luiza':   (0.08, 'Varejo',      800, 0.22),
+    'Supermercado Dia': (0.07, 'Varejo',      150, 0.15),
+    'Renner':           (0.05, 'Moda',        200, 0.40),
+    'Netshoes':         (0.05, 'Esportes',    250, 0.35),
+}
+EXEMPLO_TIPOS = {
+    # tipo de cupom: (probabilidade, investimento em marketing sobre a compra)
+    'Desconto %':      (0.4, 0.05),
+    'Cashback':        (0.3, 0.08),
+    'Frete Grátis':    (0.2, 0.03),
+    'Primeira Compra': (0.1, 0.15),
+}
+EXEMPLO_TIPOS_LOJA = ['Alimentação', 'Varejo', 'Marketplace', 'Transporte', 'Moda', 'Esportes']
+EXEMPLO_CHUNK = 1_000_000  # linhas por pedaço ao gerar bases grandes
+
+def _example_chunk(rng, num_rows, hoje):
+    """Gera um pedaço de 'num_rows' transações de exemplo terminando em 'hoje'."""
+    # Datas dos últimos ~18 meses, com mais transações em finais de semana
+    dias = np.arange(hoje - np.timedelta64(EXEMPLO_DIAS, "D"), hoje + np.timedelta64(1, "D"))
+    dia_semana = (dias.astype("int64") + 3) % 7  # 1970-01-01 foi uma quinta (3)
+    pesos = np.asarray(EXEMPLO_PESOS_DIA)[dia_semana]
+    datas = rng.choice(dias, num_rows, p=pesos / pesos.sum())
+
+    # Horários mais prováveis: almoço e jantar
+    horas = np.concatenate([
+        rng.normal(12.5, 1, num_rows // 2),
+        rng.normal(20, 1.5, num_rows - num_rows // 2),
+    ])
+    rng.shuffle(horas)
+    minutos = (np.mod(horas, 24).astype("int64") * 60 + rng.integers(0, 60, num_rows))
+    data_captura = (datas.astype("datetime64[m]") + minutos.astype("timedelta64[m]")).astype("datetime64[ns]")
+
+    # Lojas, categorias e tipos de cupom sorteados como códigos (índices)
+    lojas = list(EXEMPLO_LOJAS)
+    prob_loja, cat_loja, valor_loja, margem_loja = (np.asarray(v) for v in zip(*EXEMPLO_LOJAS.values()))
+    categorias = sorted(set(cat_loja))
+    cod_loja = rng.choice(len(lojas), num_rows, p=prob_loja)
+    cod_cat_por_loja = np.array([categorias.index(c) for c in cat_loja])
+
+    tipos = list(EXEMPLO_TIPOS)
+    prob_tipo, invest_tipo = (np.asarray(v) for v in zip(*EXEMPLO_TIPOS.values()))
+    cod_tipo = rng.choice(len(tipos), num_rows, p=prob_tipo)
+
+    # Valores realistas por loja, margens/custos e investimento por tipo de cupom
+    valor_base = valor_loja[cod_loja]
+    valor_compra = rng.normal(valor_base, valor_base * 0.3).clip(10, 5000).round(2)
+    custo_venda = (valor_compra * (1 - margem_loja[cod_loja])).round(2)
+    investimento = (invest_tipo[cod_tipo] * valor_compra + rng.uniform(0.5, 2, num_rows)).round(2)
+
+    return pd.DataFrame({
+        'data_captura': data_captura,
+        'nome_loja': pd.Categorical.from_codes(cod_loja, lojas),
+        'categoria_estabelecimento': pd.Categorical.from_codes(cod_cat_por_loja[cod_loja], categorias),
+        'tipo_cupom': pd.Categorical.from_codes(cod_tipo, tipos),
+        'valor_compra': valor_compra,
+        'custo_venda': custo_venda,
+        'lucro_bruto': (valor_compra - custo_venda).round(2),
+        'investimento_mkt': investimento,
+        'valor_cupom': rng.uniform(5, 100, num_rows).round(2),
+        'tipo_loja': pd.Categorical.from_codes(
+            rng.integers(0, len(EXEMPLO_TIPOS_LOJA), num_rows), EXEMPLO_TIPOS_LOJA
+        ),
+    })
+
+def iter_example_data(num_rows, seed=42, chunk_rows=EXEMPLO_CHUNK, hoje=None):
+    """
+    Gera os dados de exemplo em pedaços de até 'chunk_rows' linhas.
+    Serve para testar os painéis com dezenas de milhões de linhas sem montar
+    tudo na memória de uma vez. Cada pedaço tem sua própria semente derivada
+    de (seed, número do pedaço), então o resultado é sempre o mesmo.
+    """
+    hoje = np.datetime64(hoje or datetime.date.today(), "D")
+    for i, inicio in enumerate(range(0, num_rows, chunk_rows)):
+        rng = np.random.default_rng([seed, i])
+        yield _example_chunk(rng, min(chunk_rows, num_rows - inicio), hoje)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _generate_example_data_cached(num_rows, seed, hoje):
+    partes = list(iter_example_data(num_rows, seed=seed, hoje=hoje))
+    if not partes:
+        return _example_chunk(np.random.default_rng(seed), 0, np.datetime64(hoje, "D"))
+    if len(partes) == 1:
+        return partes[0]
+    # concat mantém "category" porque todos os pedaços têm as mesmas categorias
+    return pd.concat(partes, ignore_index=True)
+
+def generate_example_data(num_rows=2500, seed=42):
     """
     Cria dados de exemplo realistas quando não temos dados reais.
     Isso permite demonstrar a aplicação mesmo sem base de dados.
+    O resultado fica em cache por (num_rows, seed) — e pelo dia de hoje, já que
+    as datas terminam sempre hoje.
     """
-    np.random.seed(42)  # Para resultados consistentes
-    
-    # Gera datas dos últimos ~18 meses
-    end_date = datetime.datetime.now()
-    start_date = end_date - datetime.timedelta(days=540) 
-    
-    # Cria datas com mais transações em finais de semana
-    base_days = pd.date_range(start_date, end_date)
-    day_weights = [0.9, 0.9, 1.0, 1.1, 1.4, 1.5, 1.2]  # Segunda a Domingo
-    day_probs = [day_weights[d.weekday()] for d in base_days]
-    day_probs = np.array(day_probs) / sum(day_probs)
-    chosen_dates = np.random.choice(base_days, num_rows, p=day_probs, replace=True)
-    
-    # Horários mais prováveis: almoço e jantar
-    hours_lunch = np.random.normal(12.5, 1, num_rows // 2)
-    hours_evening = np.random.normal(20, 1.5, num_rows - (num_rows // 2))
-    hours = np.concatenate([hours_lunch, hours_evening])
-    np.random.shuffle(hours)
-    minutes = np.random.randint(0, 60, num_rows)
-    
-    # Combina datas e horários
-    final_dates = [
-        d.replace(hour=int(h % 24), minute=int(m), second=0, microsecond=0)
-        for d, h, m in zip(chosen_dates, hours, minutes)
-    ]
-    
-    df = pd.DataFrame({'data_captura': final_dates})
-    
-    # Lojas realistas com probabilidades diferentes
-    lojas = ['iFood', 'Mercado Livre', 'Amazon', 'Uber', 'Magazine Luiza', 'Supermercado Dia', 'Renner', 'Netshoes']
-    loja_probs = [0.30, 0.20, 0.15, 0.10, 0.08, 0.07, 0.05, 0.05]
-    df['nome_loja'] = np.random.choice(lojas, num_rows, p=loja_probs)
-    
-    # Categorias das lojas
-    cat_map = {
-        'iFood': 'Alimentação', 'Uber': 'Transporte', 'Supermercado Dia': 'Varejo', 'Renner': 'Moda', 
-        'Netshoes': 'Esportes', 'Mercado Livre': 'Marketplace', 'Amazon': 'Marketplace', 'Magazine Luiza': 'Varejo'
-    }
-    df['categoria_estabelecimento'] = df['nome_loja'].map(cat_map)
-    
-    # Tipos de cupom
-    tipos = ['Desconto %', 'Cashback', 'Frete Grátis', 'Primeira Compra']
-    tipo_probs = [0.4, 0.3, 0.2, 0.1]
-    df['tipo_cupom'] = np.random.choice(tipos, num_rows, p=tipo_probs)
-    
-    # Valores realistas por loja
-    valor_base_map = {
-        'iFood': 70, 'Uber': 30, 'Supermercado Dia': 150, 'Renner': 200, 
-        'Netshoes': 250, 'Mercado Livre': 180, 'Amazon': 220, 'Magazine Luiza': 800
-    }
-    df['valor_base'] = df['nome_loja'].map(valor_base_map)
-    df['valor_compra'] = np.random.normal(df['valor_base'], df['valor_base'] * 0.3).clip(10, 5000).round(2)
-    
-    # Margens e custos realistas
-    margem_map = {
-        'iFood': 0.3, 'Uber': 0.2, 'Supermercado Dia': 0.15, 'Renner': 0.4, 
-        'Netshoes': 0.35, 'Mercado Livre': 0.25, 'Amazon': 0.2, 'Magazine Luiza': 0.22
-    }
-    df['margem_bruta'] = df['nome_loja'].map(margem_map)
-    df['custo_venda'] = (df['valor_compra'] * (1 - df['margem_bruta'])).round(2)
-    df['lucro_bruto'] = (df['valor_compra'] - df['custo_venda']).round(2)
-    
-    # Investimento em marketing varia por tipo de cupom
-    invest_map = {'Desconto %': 0.05, 'Cashback': 0.08, 'Frete Grátis': 0.03, 'Primeira Compra': 0.15}
-    df['investimento_mkt'] = (df['tipo_cupom'].map(invest_map) * df['valor_compra'] + np.random.uniform(0.5, 2, num_rows)).round(2)
-    
-    # ADICIONE estas colunas específicas
-    df['valor_cupom'] = np.random.uniform(5, 100, num_rows).round(2)
-    df['tipo_loja'] = np.random.choice(
-        ['Alimentação', 'Varejo', 'Marketplace', 'Transporte', 'Moda', 'Esportes'], 
-        num_rows
-    )
-    
-    return df.drop(columns=['valor_base', 'margem_bruta'])
+    return _generate_example_data_cached(num_rows, seed, datetime.date.today().isoformat())
 
-def page_home(tx, stores):
+def page_home(tx):
     """
     Página inicial - visão geral do sistema.
     É a porta de entrada para todas as análises.
@@ -1089,44 +2821,36 @@ def page_home(tx, stores):
     
     st.markdown("---") 
 
-    # Carrega e prepara os dados
-    df, get = normcols(tx)
-    
-    # Se não há dados realais, cria dados de exemplo para demonstração
-    if df.empty:
+    # Agregados prontos (cubo diário, calculado uma vez por versão dos dados)
+    # Se não há dados reais, usa dados de exemplo para demonstração
+    if tx.empty:
         st.info("Nenhum dado encontrado. A carregar dados de exemplo.")
-        df = generate_example_data(num_rows=2500)
-        df, get = normcols(df)
+    cubo, meta = get_transaction_cube(tx, example_rows=2500)
 
     # Encontra as colunas de data e valor
-    dcol = get("data","data_captura")
-    vcol = get("valor_compra","valor")
+    dcol = meta["colunas"]["data"]
+    vcol = meta["medidas"].get("valor")
 
     # Métricas principais em cards bonitos
     c1, c2, c3, c4 = st.columns(4)
     with c1: 
-        kpi_card("Total de Cupons", f"{len(df):,}".replace(",", "."))
+        kpi_card("Total de Cupons", f"{meta['linhas']:,}".replace(",", "."))
     with c2: 
-        kpi_card("Conversões", f"{len(df):,}".replace(",", "."))
+        kpi_card("Conversões", f"{meta['linhas']:,}".replace(",", "."))
     with c3:
-        avg = df[vcol].mean() if (vcol and (vcol in df.columns)) else 0
+        n_valores = cubo["valor_n"].sum() if vcol else 0
+        avg = cubo["valor_soma"].sum() / n_valores if n_valores else 0
         kpi_card("Ticket Médio", f"R$ {avg:,.2f}".replace(",", "X").replace(".", ",").replace("X","."))
     with c4:
-        total_receita = df[vcol].sum() if (vcol and (vcol in df.columns)) else 0
+        total_receita = cubo["valor_soma"].sum() if vcol else 0
         kpi_card("Receita Total", f"R$ {total_receita:,.2f}".replace(",", "X").replace(".", ",").replace("X","."))
 
-    if not dcol or not vcol or dcol not in df.columns or vcol not in df.columns:
+    if not dcol or not vcol:
         st.warning("Dados insuficientes para gráficos.")
         return
 
     # CORREÇÃO: Adicionar key_suffix único
-    df, freq = add_time_widgets(df, dcol, key_suffix="home")
-
-    # agrega por periodicidade escolhida, mantendo eixo X em datetime (suporta range slider!)
-    df[dcol] = pd.to_datetime(df[dcol], errors="coerce")
-    df["Periodo"] = df[dcol].dt.to_period(freq).dt.to_timestamp()
-
-    resumo = df.groupby("Periodo")[vcol].agg(Receita="sum", Ticket_Médio="mean", Conversões="count").reset_index()
+    cubo, freq = add_time_widgets(cubo, "dia", meta["versao"], key_suffix="home")
 
     # switches de visualização
     c1, c2, c3 = st.columns(3)
@@ -1134,9 +2858,28 @@ def page_home(tx, stores):
     show_pts = c2.checkbox("● Mostrar marcadores", value=True, key="home_pts")
     smooth   = c3.slider("Suavização (média móvel)", 1, 6, 1, key="home_smooth")
 
+    figuras = cached_figures(
+        meta["versao"], "home",
+        time_widget_state("home") + widget_state("home_cum", "home_pts", "home_smooth"),
+        lambda: _figuras_home(cubo, show_cum, show_pts, smooth)
+    )
+    st.plotly_chart(figuras["principal"], use_container_width=True)
+
+    # FIM DA PÁGINA HOME - A SEÇÃO DE ANÁLISE DE CUPONS FOI REMOVIDA
+
+def _figuras_home(cubo, show_cum, show_pts, smooth):
+    """Gráfico da página inicial (receita, ticket médio e acumulado por período)."""
+    # agrega por periodicidade escolhida ('Periodo' já vem do filtro de tempo),
+    # mantendo eixo X em datetime (suporta range slider!)
+    resumo = cubo.groupby("Periodo").agg(Receita=("valor_soma", "sum"), Conversões=("valor_n", "sum")).reset_index()
+    # barras demais para a largura: junta períodos vizinhos (antes das médias)
+    resumo = bucket_series(resumo, "Periodo", ["Receita", "Conversões"])
+    resumo["Ticket_Médio"] = resumo["Receita"] / resumo["Conversões"].where(resumo["Conversões"] > 0)
+
     if smooth > 1:
         for col in ["Receita","Ticket_Médio","Conversões"]:
             resumo[col] = resumo[col].rolling(smooth, min_periods=1).mean()
+    resumo["Receita_Acumulada"] = resumo["Receita"].cumsum()
 
     # gráfico combinado
     fig = go.Figure()
@@ -1155,7 +2898,7 @@ def page_home(tx, stores):
     # cumulativo opcional
     if show_cum:
         fig.add_trace(go.Scatter(
-            x=resumo["Periodo"], y=resumo["Receita"].cumsum(),
+            x=resumo["Periodo"], y=resumo["Receita_Acumulada"],
             name="Receita (Acumulada)", mode="lines",
             line=dict(dash="dash"),
             hovertemplate="Período: %{x|%Y-%m}<br>Receita Acum.: R$ %{y:,.2f}<extra></extra>"
@@ -1168,9 +2911,7 @@ def page_home(tx, stores):
     )
     fig = style_fig(fig, y_fmt=",.2f")
     fig = time_axes_enhance(fig)
-    st.plotly_chart(fig, use_container_width=True)
-
-    # FIM DA PÁGINA HOME - A SEÇÃO DE ANÁLISE DE CUPONS FOI REMOVIDA
+    return {"principal": fig}
 
 def page_kpis(tx):
     """
@@ -1196,14 +2937,10 @@ def page_kpis(tx):
     """, unsafe_allow_html=True)
     st.markdown("---")
 
-    # Carrega dados
-    df, get = normcols(tx)
-    
-    # Dados de exemplo se não houver dados reais
-    if df.empty:
+    # Agregados prontos (dados de exemplo se não houver dados reais)
+    if tx.empty:
         st.info("Aguardando dados... Gerando dados de exemplo mais realistas para demonstração.")
-        df = generate_example_data(num_rows=2500)
-        df, get = normcols(df)
+    cubo, meta = get_transaction_cube(tx, example_rows=2500)
 
     # Abas para diferentes perfis executivos
     tab1, tab2, tab3 = st.tabs(["📈 Performance CEO - Conversões e Taxas", "🔧 Performance CTO - Operações", "💰 Performance CFO - Financeiro"])
@@ -1211,99 +2948,54 @@ def page_kpis(tx):
     with tab1:
         st.subheader("📈 Performance CEO - Conversões e Taxas")
 
-        dcol = get("data","data_captura")
+        dcol = meta["colunas"]["data"]
         if not dcol: 
             st.warning("Coluna de data não encontrada.")
             return
 
         # CORREÇÃO: Adicionar key_suffix único
-        df, freq = add_time_widgets(df, dcol, key_suffix="ceo")
-        df[dcol] = pd.to_datetime(df[dcol], errors="coerce")
-        df["Periodo"] = df[dcol].dt.to_period(freq).dt.to_timestamp()
-
-        conv = df.groupby("Periodo").size().rename("Conversões").reset_index()
-        conv["Taxa_Adesão_%"] = conv["Conversões"] / max(1, conv["Conversões"].max()) * 100
+        cubo, freq = add_time_widgets(cubo, "dia", meta["versao"], key_suffix="ceo")
 
         c1, c2 = st.columns(2)
         show_ma = c1.checkbox("Média móvel (3)", value=True, key="ceo_ma")
         show_norm = c2.checkbox("Normalizar 0–100%", value=False, key="ceo_norm")
 
-        if show_ma:
-            conv["Conversões_MM"] = conv["Conversões"].rolling(3, min_periods=1).mean()
-
-        y_conv = "Conversões_MM" if show_ma else "Conversões"
-        y2 = "Taxa_Adesão_%"
-
-        if show_norm:
-            conv[y_conv] = conv[y_conv] / max(1, conv[y_conv].max()) * 100
-
-        fig_ceo = go.Figure()
-        fig_ceo.add_trace(go.Bar(x=conv["Periodo"], y=conv[y_conv], name="Conversões", marker_color=PRIMARY,
-                                 hovertemplate="Período: %{x|%Y-%m}<br>Conversões: %{y:,.0f}<extra></extra>"))
-        fig_ceo.add_trace(go.Scatter(x=conv["Periodo"], y=conv[y2], name="Taxa de Adesão (%)", yaxis="y2", mode="lines+markers",
-                                     hovertemplate="Período: %{x|%Y-%m}<br>Taxa: %{y:.1f}%<extra></extra>"))
+        figuras = cached_figures(
+            meta["versao"], "kpis_ceo",
+            time_widget_state("ceo") + widget_state("ceo_ma", "ceo_norm"),
+            lambda: _figuras_ceo(cubo, show_ma, show_norm)
+        )
+        st.plotly_chart(figuras["conversoes"], use_container_width=True)
 
-        fig_ceo.update_layout(title="Conversões e Taxa de Adesão",
-                              yaxis=dict(title="Conversões" if not show_norm else "Escala Normalizada (0–100)"),
-                              yaxis2=dict(overlaying="y", side="right", title="Taxa de Adesão (%)"))
-        fig_ceo = style_fig(fig_ceo)
-        fig_ceo = time_axes_enhance(fig_ceo)
-        st.plotly_chart(fig_ceo, use_container_width=True)
 
     with tab2:
         st.subheader("🔧 Performance CTO - Operações")
 
-        dcol = get("data","data_captura")
+        dcol = meta["colunas"]["data"]
         if not dcol: 
             st.warning("Coluna de data não encontrada.")
             return
 
         # CORREÇÃO: Adicionar key_suffix único
-        df, freq = add_time_widgets(df, dcol, key_suffix="cto")
-        df[dcol] = pd.to_datetime(df[dcol], errors="coerce")
-        df["Periodo"] = df[dcol].dt.to_period(freq).dt.to_timestamp()
-
-        vol = df.groupby("Periodo").size().rename("Eventos").reset_index()
+        cubo, freq = add_time_widgets(cubo, "dia", meta["versao"], key_suffix="cto")
 
         c1, c2 = st.columns(2)
         topN = c1.slider("Top picos a anotar", 0, 10, 3, key="cto_topn")
         show_spikes = c2.checkbox("Mostrar spikes (linhas guias)", True, key="cto_spikes")
 
-        fig_cto = px.bar(vol, x="Periodo", y="Eventos", title="Volume Operacional",
-                         labels={"Periodo":"Período","Eventos":"Eventos"}, color_discrete_sequence=[PRIMARY])
-        if topN > 0:
-            top = vol.nlargest(topN, "Eventos")
-            fig_cto.add_trace(go.Scatter(x=top["Periodo"], y=top["Eventos"], mode="markers+text",
-                                         text=[f"▲ {int(v)}" for v in top["Eventos"]],
-                                         textposition="top center", name="Picos"))
-        if show_spikes:
-            fig_cto.update_xaxes(showspikes=True, spikemode="across", spikesnap="cursor", spikethickness=1)
-
-        fig_cto = style_fig(fig_cto, y_fmt=",.0f")
-        fig_cto = time_axes_enhance(fig_cto)
-        st.plotly_chart(fig_cto, use_container_width=True)
+        figuras = cached_figures(
+            meta["versao"], "kpis_cto",
+            time_widget_state("cto") + widget_state("cto_topn", "cto_spikes"),
+            lambda: _figuras_cto(cubo, topN, show_spikes)
+        )
+        st.plotly_chart(figuras["volume"], use_container_width=True)
 
     with tab3:
         st.subheader("💰 Performance CFO - Receita e ROI")
 
-        # CORREÇÃO: Busca flexível por colunas de valor e loja
-        dcol = get("data", "data_captura")
-        
-        # Busca por colunas de valor (tenta várias possibilidades)
-        vcol = None
-        possible_value_cols = ['valor_compra', 'valor', 'valor_cupom', 'valor_transacao', 'total']
-        for col in possible_value_cols:
-            if col in df.columns:
-                vcol = col
-                break
-        
-        # Busca por colunas de loja (tenta várias possibilidades)
-        scol = None
-        possible_store_cols = ['nome_loja', 'loja', 'estabelecimento', 'nome_estabelecimento', 'store']
-        for col in possible_store_cols:
-            if col in df.columns:
-                scol = col
-                break
+        # CORREÇÃO: Busca flexível por colunas de valor e loja (resolvidas no cubo)
+        vcol = meta["medidas"].get("valor")
+        scol = meta["colunas"]["loja"]
 
         if not vcol:
             st.error("""
@@ -1311,7 +3003,7 @@ def page_kpis(tx):
             
             **Colunas disponíveis no dataset:**
             """)
-            st.write(list(df.columns))
+            st.write(meta["colunas_originais"])
             st.info("""
             **Solução:**
             - Verifique se seus dados contêm uma coluna de valor (como 'valor_compra', 'valor', etc.)
@@ -1330,8 +3022,7 @@ def page_kpis(tx):
         # Se não encontrou coluna de loja, cria uma genérica
         if not scol:
             st.warning("Coluna de loja não encontrada. Usando 'Loja Genérica'.")
-            df['Loja_Generica'] = 'Loja Única'
-            scol = 'Loja_Generica'
+            cubo = cubo.assign(loja='Loja Única')  # o recorte é compartilhado: não altera
 
         c1, c2, c3 = st.columns(3)
         topN = c1.slider("Top N lojas por Receita", 5, 20, 10, key="cfo_topn")
@@ -1340,31 +3031,21 @@ def page_kpis(tx):
 
         # CORREÇÃO: Cria dados para o gráfico mesmo com colunas limitadas
         try:
-            # Agrupa por loja
-            agg = df.groupby(scol)[vcol].agg(['sum','count']).reset_index().rename(columns={'sum':'Receita','count':'Transacoes'})
-            
-            # Calcula ROI simplificado
-            agg["Investimento"] = agg["Receita"] * 0.35
-            agg["ROI"] = ((agg["Receita"] - agg["Investimento"]) / agg["Investimento"] * 100).replace([np.inf, -np.inf], np.nan).fillna(0)
-            
-            # Ordena e seleciona top N
-            agg = agg.sort_values(sort_by, ascending=False).head(topN)
+            # Tabela e gráfico (o cubo aqui já vem recortado pelo filtro de tempo do CTO)
+            figuras = cached_figures(
+                meta["versao"], "kpis_cfo",
+                time_widget_state("cto") + widget_state("cfo_topn", "cfo_roi", "cfo_sort"),
+                lambda: _figuras_cfo(cubo, meta, topN, sort_by)
+            )
 
             # Mostra dados detalhados
             st.markdown("**📊 Dados Detalhados das Lojas (Top 10)**")
             
-            # Formata os dados para exibição
-            display_data = agg.copy()
-            display_data["Receita"] = display_data["Receita"].apply(lambda x: f"R$ {x:,.2f}")
-            display_data["Investimento"] = display_data["Investimento"].apply(lambda x: f"R$ {x:,.2f}")
-            display_data["ROI"] = display_data["ROI"].apply(lambda x: f"{x:.2f}%")
-            display_data["Transacoes"] = display_data["Transacoes"].apply(lambda x: f"{x:,}")
-            
             # Mostra a tabela com os dados
             st.dataframe(
-                display_data,
+                figuras["tabela"],
                 column_config={
-                    scol: "Loja",
+                    "loja": "Loja",
                     "Receita": "Receita Total",
                     "Transacoes": "Transações",
                     "Investimento": "Investimento",
@@ -1374,41 +3055,7 @@ def page_kpis(tx):
                 hide_index=True
             )
 
-            # CORREÇÃO: Cria gráfico mesmo com dados limitados
-            fig_cfo = go.Figure()
-            fig_cfo.add_trace(go.Bar(
-                x=agg[scol].astype(str), 
-                y=agg["Receita"], 
-                name="Receita (R$)", 
-                marker_color=PRIMARY,
-                hovertemplate="Loja: %{x}<br>Receita: R$ %{y:,.2f}<extra></extra>"
-            ))
-            
-            # Adiciona ROI apenas se os valores forem válidos
-            if not agg["ROI"].isna().all() and agg["ROI"].abs().max() > 0:
-                fig_cfo.add_trace(go.Scatter(
-                    x=agg[scol].astype(str), 
-                    y=agg["ROI"], 
-                    name="ROI (%)", 
-                    yaxis="y2",
-                    mode="lines+markers", 
-                    hovertemplate="Loja: %{x}<br>ROI: %{y:.2f}%<extra></extra>"
-                ))
-            
-            fig_cfo.update_layout(
-                title="Receita e ROI por Loja",
-                xaxis_title="Loja",
-                yaxis=dict(title="Receita (R$)"),
-                yaxis2=dict(
-                    overlaying="y", 
-                    side="right", 
-                    title="ROI (%)",
-                    showgrid=False  # Remove grid do segundo eixo para melhor visualização
-                ) if not agg["ROI"].isna().all() else None
-            )
-            
-            fig_cfo = style_fig(fig_cfo, y_fmt=",.2f")
-            st.plotly_chart(fig_cfo, use_container_width=True)
+            st.plotly_chart(figuras["receita_roi"], use_container_width=True)
             
         except Exception as e:
             st.error(f"Erro ao gerar gráfico CFO: {e}")
@@ -1424,6 +3071,111 @@ def page_kpis(tx):
                 df = df_example.copy()
                 st.rerun()
 
+def _figuras_ceo(cubo, show_ma, show_norm):
+    """Gráfico do CEO: conversões por período e taxa de adesão."""
+    conv = cubo.groupby("Periodo")["n"].sum().rename("Conversões").reset_index()
+    conv = bucket_series(conv, "Periodo", ["Conversões"])  # barras: junta períodos vizinhos
+    conv["Taxa_Adesão_%"] = conv["Conversões"] / max(1, conv["Conversões"].max()) * 100
+
+    if show_ma:
+        conv["Conversões_MM"] = conv["Conversões"].rolling(3, min_periods=1).mean()
+
+    y_conv = "Conversões_MM" if show_ma else "Conversões"
+    y2 = "Taxa_Adesão_%"
+
+    if show_norm:
+        conv[y_conv] = conv[y_conv] / max(1, conv[y_conv].max()) * 100
+
+    fig_ceo = go.Figure()
+    fig_ceo.add_trace(go.Bar(x=conv["Periodo"], y=conv[y_conv], name="Conversões", marker_color=PRIMARY,
+                             hovertemplate="Período: %{x|%Y-%m}<br>Conversões: %{y:,.0f}<extra></extra>"))
+    fig_ceo.add_trace(go.Scatter(x=conv["Periodo"], y=conv[y2], name="Taxa de Adesão (%)", yaxis="y2", mode="lines+markers",
+                                 hovertemplate="Período: %{x|%Y-%m}<br>Taxa: %{y:.1f}%<extra></extra>"))
+
+    fig_ceo.update_layout(title="Conversões e Taxa de Adesão",
+                          yaxis=dict(title="Conversões" if not show_norm else "Escala Normalizada (0–100)"),
+                          yaxis2=dict(overlaying="y", side="right", title="Taxa de Adesão (%)"))
+    fig_ceo = style_fig(fig_ceo)
+    fig_ceo = time_axes_enhance(fig_ceo)
+    return {"conversoes": fig_ceo}
+
+def _figuras_cto(cubo, topN, show_spikes):
+    """Gráfico do CTO: volume operacional por período, com os picos anotados."""
+    vol = cubo.groupby("Periodo")["n"].sum().rename("Eventos").reset_index()
+    vol = bucket_series(vol, "Periodo", ["Eventos"])  # barras: junta períodos vizinhos
+    top = vol.nlargest(topN, "Eventos")   # picos das barras desenhadas
+
+    fig_cto = px.bar(vol, x="Periodo", y="Eventos", title="Volume Operacional",
+                     labels={"Periodo":"Período","Eventos":"Eventos"}, color_discrete_sequence=[PRIMARY])
+    if topN > 0:
+        fig_cto.add_trace(go.Scatter(x=top["Periodo"], y=top["Eventos"], mode="markers+text",
+                                     text=[f"▲ {int(v)}" for v in top["Eventos"]],
+                                     textposition="top center", name="Picos"))
+    if show_spikes:
+        fig_cto.update_xaxes(showspikes=True, spikemode="across", spikesnap="cursor", spikethickness=1)
+
+    fig_cto = style_fig(fig_cto, y_fmt=",.0f")
+    fig_cto = time_axes_enhance(fig_cto)
+    return {"volume": fig_cto}
+
+def _figuras_cfo(cubo, meta, topN, sort_by):
+    """Tabela e gráfico do CFO: receita e ROI das top N lojas."""
+    # Top N por receita sai do resumo da ingestão quando ele garante a resposta;
+    # senão (recorte de tempo, ordem por ROI) agrupa por loja
+    agg = top_lojas(meta.get("top_lojas"), topN, len(cubo)) if sort_by == "Receita" else None
+    if agg is None:
+        agg = cubo.groupby("loja").agg(Receita=("valor_soma", "sum"), Transacoes=("valor_n", "sum")).reset_index()
+    
+    # Calcula ROI simplificado
+    agg["Investimento"] = agg["Receita"] * 0.35
+    agg["ROI"] = ((agg["Receita"] - agg["Investimento"]) / agg["Investimento"] * 100).replace([np.inf, -np.inf], np.nan).fillna(0)
+    
+    # Ordena e seleciona top N
+    agg = agg.sort_values(sort_by, ascending=False).head(topN)
+
+    # Formata os dados para exibição
+    display_data = agg.copy()
+    display_data["Receita"] = display_data["Receita"].apply(lambda x: f"R$ {x:,.2f}")
+    display_data["Investimento"] = display_data["Investimento"].apply(lambda x: f"R$ {x:,.2f}")
+    display_data["ROI"] = display_data["ROI"].apply(lambda x: f"{x:.2f}%")
+    display_data["Transacoes"] = display_data["Transacoes"].apply(lambda x: f"{x:,}")
+    
+    # CORREÇÃO: Cria gráfico mesmo com dados limitados
+    fig_cfo = go.Figure()
+    fig_cfo.add_trace(go.Bar(
+        x=agg["loja"].astype(str), 
+        y=agg["Receita"], 
+        name="Receita (R$)", 
+        marker_color=PRIMARY,
+        hovertemplate="Loja: %{x}<br>Receita: R$ %{y:,.2f}<extra></extra>"
+    ))
+    
+    # Adiciona ROI apenas se os valores forem válidos
+    if not agg["ROI"].isna().all() and agg["ROI"].abs().max() > 0:
+        fig_cfo.add_trace(go.Scatter(
+            x=agg["loja"].astype(str), 
+            y=agg["ROI"], 
+            name="ROI (%)", 
+            yaxis="y2",
+            mode="lines+markers", 
+            hovertemplate="Loja: %{x}<br>ROI: %{y:.2f}%<extra></extra>"
+        ))
+    
+    fig_cfo.update_layout(
+        title="Receita e ROI por Loja",
+        xaxis_title="Loja",
+        yaxis=dict(title="Receita (R$)"),
+        yaxis2=dict(
+            overlaying="y", 
+            side="right", 
+            title="ROI (%)",
+            showgrid=False  # Remove grid do segundo eixo para melhor visualização
+        ) if not agg["ROI"].isna().all() else None
+    )
+    
+    fig_cfo = style_fig(fig_cfo, y_fmt=",.2f")
+    return {"tabela": display_data, "receita_roi": fig_cfo}
+
 def page_tendencias(tx):
     """
     Página de análise de tendências - entenda o comportamento dos usuários.
@@ -1443,20 +3195,17 @@ def page_tendencias(tx):
     """, unsafe_allow_html=True)
     st.markdown("---")
 
-    # Carrega dados
-    df, get = normcols(tx)
-    
-    if df.empty:
+    # Agregados prontos (cubo diário)
+    if tx.empty:
         st.info("Aguardando dados... Gerando dados de exemplo realistas para demonstração.")
-        df = generate_example_data(num_rows=2500)
-        df, get = normcols(df)
+    cubo, meta = get_transaction_cube(tx, example_rows=2500)
 
     # Encontra colunas importantes
-    dcol = get("data", "data_captura")
-    vcol = get("valor_cupom", "valor_compra", "valor")
-    scol = get("nome_estabelecimento", "nome_loja", "loja")
-    tcol = get("tipo_cupom", "tipo")
-    cat_col = get("categoria_estabelecimento", "categoria_loja")
+    dcol = meta["colunas"]["data"]
+    vcol = meta["medidas"].get("valor_cupom")
+    scol = meta["colunas"]["loja"]
+    tcol = meta["colunas"]["tipo"]
+    cat_col = meta["colunas"]["categoria"]
 
     # Verifica se temos dados mínimos
     if not dcol or not vcol or not scol or not tcol:
@@ -1465,23 +3214,10 @@ def page_tendencias(tx):
         return
 
     try:
-        # Prepara dados para análise
-        df[dcol] = pd.to_datetime(df[dcol], errors="coerce")
-        df = df.dropna(subset=[dcol, vcol, scol, tcol]) 
-        
-        # Cria colunas derivadas para análise
-        df['Mês'] = df[dcol].dt.to_period('M').astype(str)
-        df['Dia_Semana_Num'] = df[dcol].dt.weekday 
-        df['Dia_Semana'] = df[dcol].dt.day_name()
-        df['Hora'] = df[dcol].dt.hour
-        
-        # Traduz dias da semana para português
-        dias_portugues = {
-            'Monday': 'Segunda', 'Tuesday': 'Terça', 'Wednesday': 'Quarta',   
-            'Thursday': 'Quinta', 'Friday': 'Sexta', 'Saturday': 'Sábado', 'Sunday': 'Domingo'
-        }
-        df['Dia_Semana'] = df['Dia_Semana'].map(dias_portugues)
-        
+        figuras = cached_figures(
+            meta["versao"], "tendencias", (),
+            lambda: _figuras_tendencias(cubo, meta, tx, scol, vcol, tcol, cat_col)
+        )
     except Exception as e:
         st.error(f"Erro ao processar os dados: {e}")
         return
@@ -1506,63 +3242,20 @@ def page_tendencias(tx):
         </div>
         """, unsafe_allow_html=True)
         
-        # Agrupa dados por mês (SEM FILTRO DE PERÍODO)
-        uso_mensal = df.groupby('Mês').agg(
-            Receita=(vcol, 'sum'),
-            Cupons=(vcol, 'count')
-        ).reset_index()
-        
         # Container para o gráfico de evolução mensal (SEM FILTROS)
         with st.container():
             st.markdown("#### Evolução Mensal - Receita vs Volume")
-            
-            # Gráfico de receita vs volume (SEM FILTRO DE DATA)
-            fig_mensal = go.Figure()
-            fig_mensal.add_trace(go.Bar(
-                x=uso_mensal['Mês'], y=uso_mensal['Receita'], name='Receita (R$)',
-                marker_color=PRIMARY, yaxis='y1'
-            ))
-            fig_mensal.add_trace(go.Scatter(
-                x=uso_mensal['Mês'], y=uso_mensal['Cupons'], name='Volume (Cupons)',
-                mode='lines+markers', line=dict(color='#f59e0b', width=3), yaxis='y2'
-            ))
-            
-            fig_mensal.update_layout(
-                title="Evolução Mensal: Receita (Barras) e Volume (Linha)",
-                xaxis_title="Mês",
-                yaxis=dict(title='Receita (R$)'),
-                yaxis2=dict(title='Volume de Cupons', overlaying='y', side='right'),
-                legend=dict(orientation="h", yanchor="bottom", y=-0.4)
-            )
-            fig_mensal = style_fig(fig_mensal, y_fmt=",.2f")
-            fig_mensal = time_axes_enhance(fig_mensal)
-            st.plotly_chart(fig_mensal, use_container_width=True)
+            st.plotly_chart(figuras["mensal"], use_container_width=True)
 
         # Gráficos de dia da semana e hora
         col1, col2 = st.columns(2)
         with col1:
             st.markdown("#### Volume por Dia da Semana")
-            uso_diario = df.groupby(['Dia_Semana_Num', 'Dia_Semana']).size().reset_index(name='Cupons').sort_values('Dia_Semana_Num')
-            fig_diario = px.bar(
-                uso_diario, x='Dia_Semana', y='Cupons',
-                title="Volume de Cupons por Dia da Semana",
-                labels={'Dia_Semana': 'Dia da Semana', 'Cupons': 'Total de Cupons'},
-                color_discrete_sequence=["#3b82f6"]
-            )
-            fig_diario = style_fig(fig_diario)
-            st.plotly_chart(fig_diario, use_container_width=True)
+            st.plotly_chart(figuras["dia_semana"], use_container_width=True)
         
         with col2:
             st.markdown("#### Volume por Hora do Dia")
-            uso_hora = df.groupby('Hora').size().reset_index(name='Cupons')
-            fig_hora = px.bar(
-                uso_hora, x='Hora', y='Cupons',
-                title="Volume de Cupons por Hora do Dia",
-                labels={'Hora': 'Hora (0-23)', 'Cupons': 'Total de Cupons'},
-                color_discrete_sequence=["#10b981"]
-            )
-            fig_hora = style_fig(fig_hora)
-            st.plotly_chart(fig_hora, use_container_width=True)
+            st.plotly_chart(figuras["hora"], use_container_width=True)
 
     with tab2:
         st.subheader("Comportamento por Estabelecimento")
@@ -1580,58 +3273,18 @@ def page_tendencias(tx):
         col1, col2 = st.columns(2)
         
         with col1:
-            # Top 10 lojas por receita
-            receita_lojas = df.groupby(scol)[vcol].sum().nlargest(10).sort_values(ascending=True)
-            fig_lojas_receita = px.bar(
-                receita_lojas, y=receita_lojas.index, x=receita_lojas.values,
-                title="Top 10 Lojas por Receita Total",
-                labels={'y': 'Loja', 'x': 'Receita (R$)'},
-                orientation='h', text_auto=',.2s',
-                color_discrete_sequence=[PRIMARY]
-            )
-            fig_lojas_receita = style_fig(fig_lojas_receita, x_fmt=",.2f")
-            st.plotly_chart(fig_lojas_receita, use_container_width=True)
+            st.plotly_chart(figuras["lojas_receita"], use_container_width=True)
         
         with col2:
-            # Top 10 lojas por volume
-            volume_lojas = df[scol].value_counts().nlargest(10).sort_values(ascending=True)
-            fig_lojas_volume = px.bar(
-                volume_lojas, y=volume_lojas.index, x=volume_lojas.values,
-                title="Top 10 Lojas por Volume de Cupons",
-                labels={'y': 'Loja', 'x': 'Quantidade de Cupons'},
-                orientation='h', text_auto=True,
-                color_discrete_sequence=["#f59e0b"]
-            )
-            fig_lojas_volume = style_fig(fig_lojas_volume)
-            st.plotly_chart(fig_lojas_volume, use_container_width=True)
+            st.plotly_chart(figuras["lojas_volume"], use_container_width=True)
 
         col1, col2 = st.columns(2)
         with col1:
-            # Ticket médio por loja
-            ticket_lojas = df.groupby(scol)[vcol].mean().nlargest(10).sort_values(ascending=True)
-            fig_ticket = px.bar(
-                ticket_lojas, y=ticket_lojas.index, x=ticket_lojas.values,
-                title="Ticket Médio por Loja (Top 10)",
-                labels={'y': 'Loja', 'x': 'Ticket Médio (R$)'},
-                orientation='h', text_auto=',.2f',
-                color_discrete_sequence=['#00CC96']
-            )
-            fig_ticket = style_fig(fig_ticket, x_fmt=",.2f")
-            st.plotly_chart(fig_ticket, use_container_width=True)
+            st.plotly_chart(figuras["ticket"], use_container_width=True)
         
         with col2:
-            # Distribuição por categoria (se disponível)
-            if cat_col in df.columns:
-                receita_categoria = df.groupby(cat_col)[vcol].sum()
-                fig_cat_pie = px.pie(
-                    receita_categoria, values=receita_categoria.values, names=receita_categoria.index,
-                    title="Distribuição da Receita por Categoria de Loja",
-                    color_discrete_sequence=px.colors.qualitative.Set3,
-                    hole=0.3  # Donut chart
-                )
-                fig_cat_pie.update_traces(textposition='inside', textinfo='percent+label')
-                fig_cat_pie = style_fig(fig_cat_pie)
-                st.plotly_chart(fig_cat_pie, use_container_width=True)
+            if cat_col:
+                st.plotly_chart(figuras["categorias"], use_container_width=True)
             else:
                 st.info("Coluna 'categoria_estabelecimento' não encontrada. Pulando gráfico de categorias.")
 
@@ -1652,46 +3305,197 @@ def page_tendencias(tx):
         col1, col2 = st.columns(2)
         
         with col1:
-            # Volume por tipo de cupom
-            tipos_cupom_vol = df[tcol].value_counts()
-            fig_tipos_vol = px.pie(
-                tipos_cupom_vol, values=tipos_cupom_vol.values, names=tipos_cupom_vol.index,
-                title="Volume por Tipo de Cupom (Contagem)",
-                color_discrete_sequence=px.colors.qualitative.Pastel
-            )
-            fig_tipos_vol = style_fig(fig_tipos_vol)
-            st.plotly_chart(fig_tipos_vol, use_container_width=True)
+            st.plotly_chart(figuras["tipos_volume"], use_container_width=True)
         
         with col2:
-            # Receita por tipo de cupom
-            tipos_cupom_rec = df.groupby(tcol)[vcol].sum()
-            fig_tipos_rec = px.pie(
-                tipos_cupom_rec, values=tipos_cupom_rec.values, names=tipos_cupom_rec.index,
-                title="Receita Gerada por Tipo de Cupom (R$)", 
-                hole=0.3,
-                color_discrete_sequence=px.colors.qualitative.Pastel
-            )
-            fig_tipos_rec = style_fig(fig_tipos_rec)
-            st.plotly_chart(fig_tipos_rec, use_container_width=True)
+            st.plotly_chart(figuras["tipos_receita"], use_container_width=True)
             
         
         # Box plot de distribuição de valores
         st.markdown("#### Distribuição de Valores por Loja e Tipo de Cupom")
-        df_sample = df.sample(n=min(2000, len(df)))  # Amostra para performance
-        top_10_lojas = df[scol].value_counts().nlargest(10).index
-        df_sample_top10 = df_sample[df_sample[scol].isin(top_10_lojas)]
+        st.plotly_chart(figuras["distribuicao"], use_container_width=True)
+
+def tendencias_bundle(cubo) -> dict:
+    """
+    Todas as somas da página de tendências numa passada só pelo cubo: cada
+    dimensão (mês, dia da semana, hora, loja, categoria, tipo) vira um código
+    inteiro e Receita/Cupons são somados com np.bincount, sem um groupby por
+    gráfico. Devolve {dimensão: DataFrame com Receita e Cupons}, em ordem de rótulo.
+    """
+    # Só células com data, loja e tipo preenchidos; contagens usam valores não vazios
+    validas = (cubo["dia"].notna() & cubo["loja"].notna() & cubo["tipo"].notna()).to_numpy()
+    receita = np.nan_to_num(cubo["valor_cupom_soma"].to_numpy(dtype=np.float64, na_value=np.nan)[validas])
+    cupons = np.nan_to_num(cubo["valor_cupom_n"].to_numpy(dtype=np.float64, na_value=np.nan)[validas])
+
+    def somar(valores, nome):
+        codigos, rotulos = pd.factorize(valores, sort=True)
+        ok = codigos >= 0                        # rótulo vazio fica de fora (como no groupby)
+        return pd.DataFrame({
+            "Receita": np.bincount(codigos[ok], receita[ok], len(rotulos)),
+            "Cupons": np.bincount(codigos[ok], cupons[ok], len(rotulos)).round().astype(np.int64),
+        }, index=pd.Index(rotulos, name=nome))
+
+    meses = cubo["dia"].to_numpy()[validas].astype("datetime64[M]")
+    mensal = somar(meses, "Mês")
+    mensal.index = pd.Index(np.datetime_as_string(mensal.index.to_numpy(), unit="M"), name="Mês")
+    return {
+        "mensal": mensal,
+        "dia_semana": somar(cubo["dia_semana"].to_numpy()[validas].astype(np.int64), "Dia_Semana_Num"),
+        "hora": somar(cubo["hora"].to_numpy()[validas].astype(np.int64), "Hora"),
+        "lojas": somar(cubo["loja"].to_numpy()[validas], "loja"),
+        "categorias": somar(cubo["categoria"].to_numpy()[validas], "categoria"),
+        "tipos": somar(cubo["tipo"].to_numpy()[validas], "tipo"),
+    }
+
+def _figuras_tendencias(cubo, meta, tx, scol, vcol, tcol, cat_col):
+    """Todos os gráficos da página de tendências, a partir do cubo diário."""
+    somas = tendencias_bundle(cubo)
+    figuras = {}
 
-        fig_dist = px.box(
-            df_sample_top10, 
-            x=scol,
-            y=vcol,
-            color=tcol,
-            title="Distribuição do Valor da Compra por Loja (Top 10) e Tipo de Cupom",
-            labels={vcol: "Valor da Compra (R$)", scol: "Loja", tcol: "Tipo de Cupom"}
+    por_loja = somas["lojas"]
+    top_volume = por_loja["Cupons"].nlargest(10)
+
+    # Evolução por mês (SEM FILTRO DE PERÍODO)
+    uso_mensal = somas["mensal"].reset_index()
+
+    # Gráfico de receita vs volume (SEM FILTRO DE DATA)
+    fig_mensal = go.Figure()
+    fig_mensal.add_trace(go.Bar(
+        x=uso_mensal['Mês'], y=uso_mensal['Receita'], name='Receita (R$)',
+        marker_color=PRIMARY, yaxis='y1'
+    ))
+    fig_mensal.add_trace(go.Scatter(
+        x=uso_mensal['Mês'], y=uso_mensal['Cupons'], name='Volume (Cupons)',
+        mode='lines+markers', line=dict(color='#f59e0b', width=3), yaxis='y2'
+    ))
+
+    fig_mensal.update_layout(
+        title="Evolução Mensal: Receita (Barras) e Volume (Linha)",
+        xaxis_title="Mês",
+        yaxis=dict(title='Receita (R$)'),
+        yaxis2=dict(title='Volume de Cupons', overlaying='y', side='right'),
+        legend=dict(orientation="h", yanchor="bottom", y=-0.4)
+    )
+    fig_mensal = style_fig(fig_mensal, y_fmt=",.2f")
+    fig_mensal = time_axes_enhance(fig_mensal)
+    figuras["mensal"] = fig_mensal
+
+    uso_diario = somas["dia_semana"]["Cupons"].reset_index()
+    uso_diario["Dia_Semana"] = uso_diario["Dia_Semana_Num"].map(DIAS_SEMANA_PT)
+    fig_diario = px.bar(
+        uso_diario, x='Dia_Semana', y='Cupons',
+        title="Volume de Cupons por Dia da Semana",
+        labels={'Dia_Semana': 'Dia da Semana', 'Cupons': 'Total de Cupons'},
+        color_discrete_sequence=["#3b82f6"]
+    )
+    fig_diario = style_fig(fig_diario)
+    figuras["dia_semana"] = fig_diario
+
+    uso_hora = somas["hora"]["Cupons"].reset_index()
+    fig_hora = px.bar(
+        uso_hora, x='Hora', y='Cupons',
+        title="Volume de Cupons por Hora do Dia",
+        labels={'Hora': 'Hora (0-23)', 'Cupons': 'Total de Cupons'},
+        color_discrete_sequence=["#10b981"]
+    )
+    fig_hora = style_fig(fig_hora)
+    figuras["hora"] = fig_hora
+
+    # Top 10 lojas por receita
+    receita_lojas = por_loja["Receita"].nlargest(10).sort_values(ascending=True)
+    fig_lojas_receita = px.bar(
+        receita_lojas, y=receita_lojas.index, x=receita_lojas.values,
+        title="Top 10 Lojas por Receita Total",
+        labels={'y': 'Loja', 'x': 'Receita (R$)'},
+        orientation='h', text_auto=',.2s',
+        color_discrete_sequence=[PRIMARY]
+    )
+    fig_lojas_receita = style_fig(fig_lojas_receita, x_fmt=",.2f")
+    figuras["lojas_receita"] = fig_lojas_receita
+
+    # Top 10 lojas por volume
+    volume_lojas = top_volume.sort_values(ascending=True)
+    fig_lojas_volume = px.bar(
+        volume_lojas, y=volume_lojas.index, x=volume_lojas.values,
+        title="Top 10 Lojas por Volume de Cupons",
+        labels={'y': 'Loja', 'x': 'Quantidade de Cupons'},
+        orientation='h', text_auto=True,
+        color_discrete_sequence=["#f59e0b"]
+    )
+    fig_lojas_volume = style_fig(fig_lojas_volume)
+    figuras["lojas_volume"] = fig_lojas_volume
+
+    # Ticket médio por loja
+    ticket_lojas = (por_loja["Receita"] / por_loja["Cupons"].where(por_loja["Cupons"] > 0)).nlargest(10).sort_values(ascending=True)
+    fig_ticket = px.bar(
+        ticket_lojas, y=ticket_lojas.index, x=ticket_lojas.values,
+        title="Ticket Médio por Loja (Top 10)",
+        labels={'y': 'Loja', 'x': 'Ticket Médio (R$)'},
+        orientation='h', text_auto=',.2f',
+        color_discrete_sequence=['#00CC96']
+    )
+    fig_ticket = style_fig(fig_ticket, x_fmt=",.2f")
+    figuras["ticket"] = fig_ticket
+
+    # Distribuição por categoria (se disponível)
+    if cat_col:
+        receita_categoria = somas["categorias"]["Receita"]
+        fig_cat_pie = px.pie(
+            receita_categoria, values=receita_categoria.values, names=receita_categoria.index,
+            title="Distribuição da Receita por Categoria de Loja",
+            color_discrete_sequence=px.colors.qualitative.Set3,
+            hole=0.3  # Donut chart
         )
-        
-        fig_dist = style_fig(fig_dist, y_fmt=",.2f")
-        st.plotly_chart(fig_dist, use_container_width=True)
+        fig_cat_pie.update_traces(textposition='inside', textinfo='percent+label')
+        fig_cat_pie = style_fig(fig_cat_pie)
+        figuras["categorias"] = fig_cat_pie
+
+    # Volume por tipo de cupom
+    tipos_cupom_vol = somas["tipos"]["Cupons"].sort_values(ascending=False)
+    fig_tipos_vol = px.pie(
+        tipos_cupom_vol, values=tipos_cupom_vol.values, names=tipos_cupom_vol.index,
+        title="Volume por Tipo de Cupom (Contagem)",
+        color_discrete_sequence=px.colors.qualitative.Pastel
+    )
+    fig_tipos_vol = style_fig(fig_tipos_vol)
+    figuras["tipos_volume"] = fig_tipos_vol
+
+    # Receita por tipo de cupom
+    tipos_cupom_rec = somas["tipos"]["Receita"]
+    fig_tipos_rec = px.pie(
+        tipos_cupom_rec, values=tipos_cupom_rec.values, names=tipos_cupom_rec.index,
+        title="Receita Gerada por Tipo de Cupom (R$)", 
+        hole=0.3,
+        color_discrete_sequence=px.colors.qualitative.Pastel
+    )
+    fig_tipos_rec = style_fig(fig_tipos_rec)
+    figuras["tipos_receita"] = fig_tipos_rec
+
+    # (o box plot precisa dos valores individuais: usa a amostra estável por
+    # loja e tipo que o cubo guardou na ingestão)
+    top_10_lojas = top_volume.index
+    amostra = meta.get("amostra")
+    if amostra is not None:
+        df_sample_top10 = (amostra.loc[amostra["loja"].isin(top_10_lojas), ["loja", "valor", "tipo"]]
+                                  .rename(columns={"loja": scol, "valor": vcol, "tipo": tcol}))
+    else:
+        df, _ = normcols(tx if not tx.empty else generate_example_data(num_rows=2500))
+        df = df[[scol, vcol, tcol]].dropna()
+        df_sample = df.sample(n=min(2000, len(df)), random_state=42)  # Amostra para performance
+        df_sample_top10 = df_sample[df_sample[scol].isin(top_10_lojas)]
+
+    fig_dist = px.box(
+        df_sample_top10, 
+        x=scol,
+        y=vcol,
+        color=tcol,
+        title="Distribuição do Valor da Compra por Loja (Top 10) e Tipo de Cupom",
+        labels={vcol: "Valor da Compra (R$)", scol: "Loja", tcol: "Tipo de Cupom"}
+    )
+
+    fig_dist = style_fig(fig_dist, y_fmt=",.2f")
+    figuras["distribuicao"] = fig_dist
+    return figuras
 
 def page_financeiro(tx):
     """
@@ -1712,35 +3516,31 @@ def page_financeiro(tx):
     """, unsafe_allow_html=True)
     st.markdown("---")
 
-    # Carrega dados
-    df, get = normcols(tx)
-    
-    # Dados de exemplo se necessário
-    if df.empty:
+    # Agregados prontos (dados de exemplo se necessário)
+    if tx.empty:
         st.info("Sem dados financeiros suficientes em assets/transacoes.xlsx. A carregar dados de exemplo.")
-        df = generate_example_data(num_rows=1000)
-        df, get = normcols(df)
+    cubo, meta = get_transaction_cube(tx, example_rows=1000)
 
-    dcol = get("data","data_captura")
-    vcol = get("valor_compra","valor")
+    dcol = meta["colunas"]["data"]
+    vcol = meta["medidas"].get("valor")
 
-    if not (dcol and vcol) or any(c not in df.columns for c in [dcol, vcol]):
+    if not (dcol and vcol):
         st.info("Sem dados suficientes.")
         return
 
     # CORREÇÃO: Adicionar key_suffix único
-    df, freq = add_time_widgets(df, dcol, key_suffix="fin")
-    df[dcol] = pd.to_datetime(df[dcol], errors="coerce")
-    df["Periodo"] = df[dcol].dt.to_period(freq).dt.to_timestamp()
-
-    resumo = df.groupby("Periodo")[vcol].agg(Receita="sum", Ticket="mean").reset_index()
-    resumo["Lucro"] = resumo["Receita"]*0.65
-    resumo["ROI"] = np.where(resumo["Receita"]>0, (resumo["Lucro"]/(resumo["Receita"]*0.35))*100, np.nan)
+    cubo, freq = add_time_widgets(cubo, "dia", meta["versao"], key_suffix="fin")
 
     c1, c2 = st.columns(2)
     cum  = c1.checkbox("📈 Mostrar acumulado", False, key="fin_cum")
     pts  = c2.checkbox("● Marcadores", True, key="fin_pts")
 
+    figuras = cached_figures(
+        meta["versao"], "financeiro",
+        time_widget_state("fin") + widget_state("fin_cum", "fin_pts"),
+        lambda: _figuras_financeiro(cubo, cum, pts)
+    )
+
     # ATUALIZAÇÃO: Adicionar legendas explicativas nas abas
     tabs = st.tabs([
         "💰 Receita - Valor total das vendas", 
@@ -1749,19 +3549,8 @@ def page_financeiro(tx):
         "📈 ROI - Retorno sobre investimento"
     ])
 
-    def _line(df_, y, title, yfmt=",.2f", color=PRIMARY):
-        fig = px.line(df_, x="Periodo", y=y, title=title, labels={"Periodo":"Período", y:y},
-                      color_discrete_sequence=[color])
-        fig.update_traces(mode="lines+markers" if pts else "lines", line=dict(width=3))
-        fig = style_fig(fig, y_fmt=yfmt)
-        fig = time_axes_enhance(fig)
-        return fig
-
     with tabs[0]:
-        dfp = resumo.copy()
-        if cum:
-            dfp["Receita"] = dfp["Receita"].cumsum()
-        st.plotly_chart(_line(dfp, "Receita", "Receita Total por Período"), use_container_width=True)
+        st.plotly_chart(figuras["receita"], use_container_width=True)
         
         # Legenda adicional para Receita
         st.markdown("""
@@ -1774,7 +3563,7 @@ def page_financeiro(tx):
         """, unsafe_allow_html=True)
 
     with tabs[1]:
-        st.plotly_chart(_line(resumo, "Ticket", "Ticket Médio por Período"), use_container_width=True)
+        st.plotly_chart(figuras["ticket"], use_container_width=True)
         
         # Legenda adicional para Ticket
         st.markdown("""
@@ -1787,10 +3576,7 @@ def page_financeiro(tx):
         """, unsafe_allow_html=True)
 
     with tabs[2]:
-        dfp = resumo.copy()
-        if cum:
-            dfp["Lucro"] = dfp["Lucro"].cumsum()
-        st.plotly_chart(_line(dfp, "Lucro", "Lucro Estimado por Período"), use_container_width=True)
+        st.plotly_chart(figuras["lucro"], use_container_width=True)
         
         # Legenda adicional para Lucro
         st.markdown("""
@@ -1803,7 +3589,7 @@ def page_financeiro(tx):
         """, unsafe_allow_html=True)
 
     with tabs[3]:
-        st.plotly_chart(_line(resumo, "ROI", "ROI (%) por Período", yfmt=",.2f", color="#7E7E7E"), use_container_width=True)
+        st.plotly_chart(figuras["roi"], use_container_width=True)
         
         # Legenda adicional para ROI
         st.markdown("""
@@ -1815,6 +3601,38 @@ def page_financeiro(tx):
         </div>
         """, unsafe_allow_html=True)
 
+def _figuras_financeiro(cubo, cum, pts):
+    """Gráficos do painel financeiro: receita, ticket, lucro e ROI por período."""
+    resumo = cubo.groupby("Periodo").agg(Receita=("valor_soma", "sum"), n=("valor_n", "sum")).reset_index()
+    resumo["Ticket"] = resumo["Receita"] / resumo["n"].where(resumo["n"] > 0)
+    resumo["Lucro"] = resumo["Receita"]*0.65
+    resumo["ROI"] = np.where(resumo["Receita"]>0, (resumo["Lucro"]/(resumo["Receita"]*0.35))*100, np.nan)
+
+    def _line(df_, y, title, yfmt=",.2f", color=PRIMARY):
+        df_ = downsample_series(df_, "Periodo", y)
+        fig = px.line(df_, x="Periodo", y=y, title=title, labels={"Periodo":"Período", y:y},
+                      color_discrete_sequence=[color])
+        fig.update_traces(mode="lines+markers" if pts else "lines", line=dict(width=3))
+        fig = style_fig(fig, y_fmt=yfmt)
+        fig = time_axes_enhance(fig)
+        return fig
+
+    figuras = {}
+    dfp = resumo.copy()
+    if cum:
+        dfp["Receita"] = dfp["Receita"].cumsum()
+    figuras["receita"] = _line(dfp, "Receita", "Receita Total por Período")
+
+    figuras["ticket"] = _line(resumo, "Ticket", "Ticket Médio por Período")
+
+    dfp = resumo.copy()
+    if cum:
+        dfp["Lucro"] = dfp["Lucro"].cumsum()
+    figuras["lucro"] = _line(dfp, "Lucro", "Lucro Estimado por Período")
+
+    figuras["roi"] = _line(resumo, "ROI", "ROI (%) por Período", yfmt=",.2f", color="#7E7E7E")
+    return figuras
+
 def page_eco():
     """
     Página de contexto econômico - mostra indicadores macroeconômicos.
@@ -1878,14 +3696,8 @@ def page_eco():
 
     st.markdown("---")
 
-    # Carrega dados econômicos
-    if os.path.exists(ECON_PATH):
-        try:
-            eco = pd.read_csv(ECON_PATH)
-        except Exception:
-            eco = pd.DataFrame()
-    else:
-        eco = pd.DataFrame()
+    # Carrega dados econômicos (sob demanda, pelo registro de datasets)
+    eco = get_dataset("economia")
 
     def _normalize_cols(df):
         """
@@ -2153,10 +3965,6 @@ def page_simulacaologin():
     """
     st.markdown(metric_style, unsafe_allow_html=True)
 
-    # Cria arquivo de usos de cupom se não existir
-    if not os.path.exists(CUPOM_USOS_PATH):
-        pd.DataFrame(columns=["email","data","loja","tipo","valor","local"]).to_csv(CUPOM_USOS_PATH, index=False)
-
     # Verifica se usuário está logado
     email = st.session_state.get("user_email")
     if not email:
@@ -2164,18 +3972,17 @@ def page_simulacaologin():
         return
 
     # Carrega dados do usuário
-    df_users = load_users()
-    user_data = df_users[df_users["email"] == email]
+    user_data = buscar_usuario(email)
     
-    if user_data.empty:
+    if user_data is None:
         st.error("Usuário não encontrado.")
         return
         
     # Extrai dados do usuário
-    cupons_usados = int(user_data["cupons_usados"].iloc[0]) if not pd.isna(user_data["cupons_usados"].iloc[0]) else 0
-    total_economizado = float(user_data["total_economizado"].iloc[0]) if not pd.isna(user_data["total_economizado"].iloc[0]) else 0.0
-    xp = int(user_data["xp"].iloc[0]) if not pd.isna(user_data["xp"].iloc[0]) else 0
-    nivel_id = int(user_data["nivel"].iloc[0]) if not pd.isna(user_data["nivel"].iloc[0]) else 1
+    cupons_usados = int(user_data["cupons_usados"]) if not pd.isna(user_data["cupons_usados"]) else 0
+    total_economizado = float(user_data["total_economizado"]) if not pd.isna(user_data["total_economizado"]) else 0.0
+    xp = int(user_data["xp"]) if not pd.isna(user_data["xp"]) else 0
+    nivel_id = int(user_data["nivel"]) if not pd.isna(user_data["nivel"]) else 1
     
     if nivel_id not in gamificacao.niveis:
         nivel_id = 1
@@ -2258,7 +4065,7 @@ def page_simulacaologin():
             st.markdown("**🏅 Conquistas Recentes**")
             conquistas_desbloqueadas = []
             for key, conquista in gamificacao.conquistas.items():
-                if user_data[f"conquista_{key}"].iloc[0] if f"conquista_{key}" in user_data.columns else False:
+                if user_data.get(f"conquista_{key}", False):
                     conquistas_desbloqueadas.append(conquista)
             
             if conquistas_desbloqueadas:
@@ -2326,17 +4133,15 @@ def page_simulacaologin():
                 # Atualiza gamificação e verifica conquistas
                 conquistas_desbloqueadas = atualizar_usuario_gamificacao(email, cupom_data)
                 
-                # Salva no histórico
-                usos = pd.read_csv(CUPOM_USOS_PATH) if os.path.exists(CUPOM_USOS_PATH) else pd.DataFrame(columns=["email","data","loja","tipo","valor","local"])
-                usos = pd.concat([usos, pd.DataFrame([{
+                # Salva no histórico (acrescenta uma linha no fim do log)
+                get_usos_log().registrar({
                     "email": email, 
                     "data": datetime.datetime.now().isoformat(),
                     "loja": loja, 
                     "tipo": tipo, 
                     "valor": float(valor), 
                     "local": local
-                }])], ignore_index=True)
-                usos.to_csv(CUPOM_USOS_PATH, index=False)
+                })
 
                 st.success("🎉 Cupom registrado com sucesso!")
                 
@@ -2388,12 +4193,16 @@ def page_simulacaologin():
         st.plotly_chart(fig_progresso, use_container_width=True)
         
         # Métricas de diversificação
+        try:
+            estado_usuario = EstadoGamificacao.from_usuario(user_data)
+        except ValueError:
+            estado_usuario = EstadoGamificacao()  # só para exibir; nada é gravado
         col1, col2, col3 = st.columns(3)
         with col1:
-            lojas_val = user_data["lojas_visitadas"].iloc[0].count(",") + 1 if user_data["lojas_visitadas"].iloc[0] != "[]" else 0
+            lojas_val = estado_usuario.num_lojas
             st.markdown(f'<div class="black-metric-label">🏪 Lojas Diferentes</div><div class="black-metric-value">{lojas_val}</div>', unsafe_allow_html=True)
         with col2:
-            tipos_val = user_data["tipos_usados"].iloc[0].count(",") + 1 if user_data["tipos_usados"].iloc[0] != "[]" else 0
+            tipos_val = len(estado_usuario.tipos)
             st.markdown(f'<div class="black-metric-label">🎯 Tipos de Cupom</div><div class="black-metric-value">{tipos_val}</div>', unsafe_allow_html=True)
         with col3:
             economia_media = total_economizado / cupons_usados if cupons_usados > 0 else 0
@@ -2410,15 +4219,17 @@ def page_simulacaologin():
             valor_medio_simular = st.slider("Valor médio por cupom (R$)", 10.0, 500.0, 100.0, key="sim_valor")
             
             if st.button("🚀 Executar Simulação", use_container_width=True, key="sim_btn"):
-                # Simula vários cupons de uma vez
-                for i in range(num_cupons_simular):
-                    cupom_simulado = {
+                # Simula vários cupons de uma vez (uma única gravação no final)
+                cupons_simulados = [
+                    {
                         "loja": f"Loja Simulada {i+1}",
-                        "tipo": np.random.choice(["Desconto", "Cashback", "Fidelidade"]),
+                        "tipo": str(np.random.choice(["Desconto", "Cashback", "Fidelidade"])),
                         "valor": valor_medio_simular * np.random.uniform(0.5, 1.5),
                         "local": "Simulação"
                     }
-                    atualizar_usuario_gamificacao(email, cupom_simulado)
+                    for i in range(num_cupons_simular)
+                ]
+                atualizar_usuario_gamificacao_lote(email, cupons_simulados)
                 
                 st.success(f"✅ {num_cupons_simular} cupons simulados com sucesso!")
                 st.rerun()
@@ -2447,7 +4258,7 @@ def page_simulacaologin():
         # Mostra todas as conquistas disponíveis
         for idx, (conquista_id, conquista) in enumerate(gamificacao.conquistas.items()):
             col_idx = idx % 2
-            desbloqueada = user_data[f"conquista_{conquista_id}"].iloc[0] if f"conquista_{conquista_id}" in user_data.columns else False
+            desbloqueada = user_data.get(f"conquista_{conquista_id}", False)
             
             with conquistas_cols[col_idx]:
                 bg_color = "#f0f8f0" if desbloqueada else "#f5f5f5"
@@ -2471,46 +4282,44 @@ def page_simulacaologin():
     # Histórico de Usos
     st.markdown("---")
     st.subheader("📋 Histórico de Cupons")
-    if os.path.exists(CUPOM_USOS_PATH):
-        hist = pd.read_csv(CUPOM_USOS_PATH)
-        hist = hist[hist["email"] == email]
-        if not hist.empty:
-            hist["data"] = pd.to_datetime(hist["data"]).dt.strftime("%d/%m/%Y %H:%M")
-            hist["economia_estimada"] = hist["valor"] * 0.1  # 10% de economia
-            st.dataframe(
-                hist.sort_values("data", ascending=False).style.format({
-                    "valor": "R$ {:.2f}",
-                    "economia_estimada": "R$ {:.2f}"
-                }), 
-                use_container_width=True
-            )
-            
-            # Métricas resumidas do histórico
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.markdown(f'''
-                    <div class="metric-box">
-                        <div class="black-metric-label">Total de Cupons</div>
-                        <div class="black-metric-value">{len(hist)}</div>
-                    </div>
-                ''', unsafe_allow_html=True)
-            with col2:
-                st.markdown(f'''
-                    <div class="metric-box">
-                        <div class="black-metric-label">Economia Total</div>
-                        <div class="black-metric-value">R$ {hist["economia_estimada"].sum():.2f}</div>
-                    </div>
-                ''', unsafe_allow_html=True)
-            with col3:
-                lojas_unicas = hist["loja"].nunique()
-                st.markdown(f'''
-                    <div class="metric-box">
-                        <div class="black-metric-label">Lojas Diferentes</div>
-                        <div class="black-metric-value">{lojas_unicas}</div>
-                    </div>
-                ''', unsafe_allow_html=True)
-        else:
-            st.info("Nenhum cupom registrado ainda.")
+    hist = get_usos_log().historico(email)
+    if not hist.empty:
+        hist["data"] = pd.to_datetime(hist["data"]).dt.strftime("%d/%m/%Y %H:%M")
+        hist["economia_estimada"] = hist["valor"] * 0.1  # 10% de economia
+        st.dataframe(
+            hist.sort_values("data", ascending=False).style.format({
+                "valor": "R$ {:.2f}",
+                "economia_estimada": "R$ {:.2f}"
+            }), 
+            use_container_width=True
+        )
+        
+        # Métricas resumidas do histórico
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.markdown(f'''
+                <div class="metric-box">
+                    <div class="black-metric-label">Total de Cupons</div>
+                    <div class="black-metric-value">{len(hist)}</div>
+                </div>
+            ''', unsafe_allow_html=True)
+        with col2:
+            st.markdown(f'''
+                <div class="metric-box">
+                    <div class="black-metric-label">Economia Total</div>
+                    <div class="black-metric-value">R$ {hist["economia_estimada"].sum():.2f}</div>
+                </div>
+            ''', unsafe_allow_html=True)
+        with col3:
+            lojas_unicas = hist["loja"].nunique()
+            st.markdown(f'''
+                <div class="metric-box">
+                    <div class="black-metric-label">Lojas Diferentes</div>
+                    <div class="black-metric-value">{lojas_unicas}</div>
+                </div>
+            ''', unsafe_allow_html=True)
+    else:
+        st.info("Nenhum cupom registrado ainda.")
 
 def page_sobre():
     """
@@ -2668,6 +4477,9 @@ def main():
     """
     # Inicializa o estado da sessão
     init_session_state()
+
+    # Vigia a pasta data/ em segundo plano
+    start_data_refresher()
     
     # Verifica se há um login persistente
     if not st.session_state.auth:
@@ -2680,22 +4492,23 @@ def main():
         else:
             signup_screen()
     else:
-        # Usuário está logado - carrega dados e mostra o dashboard
-        tx = transacoes if not transacoes.empty else pd.DataFrame()
-        stores = lojas if not lojas.empty else pd.DataFrame()
+        # Usuário está logado - mostra o dashboard
+        # (cada página só carrega os datasets que realmente usa; as planilhas
+        # que elas usam começam a ser lidas em segundo plano)
+        start_preload()
         sidebar_nav()
         
         page = st.session_state.get("page", "home")
         
         # Roteamento para as diferentes páginas
         if page == "home": 
-            page_home(tx, stores)
+            page_home(get_dataset("transacoes"))
         elif page == "kpis": 
-            page_kpis(tx)
+            page_kpis(get_dataset("transacoes"))
         elif page == "tendencias":
-            page_tendencias(tx)
+            page_tendencias(get_dataset("transacoes"))
         elif page == "fin": 
-            page_financeiro(tx)
+            page_financeiro(get_dataset("transacoes"))
         elif page == "eco": 
             page_eco()
         elif page == "sim":
@@ -0,0 +1,81 @@
+"""
+Benchmark: memória de cada worker com as transações na memória x mapeadas.
+
+Simula vários processos do Streamlit abrindo o mesmo dataset de transações.
+"Antes": cada processo lê o Parquet e fica com a sua cópia dos dados.
+"Depois": cada processo abre o Arrow com pa.memory_map (_open_arrow_cache) e
+as colunas apontam para as páginas do arquivo, divididas entre os processos.
+Mede a memória PRIVADA de cada processo (Private_Clean + Private_Dirty do
+/proc/self/smaps_rollup), por isso só roda no Linux.
+
+Uso (na raiz do projeto):
+    python benchmarks/bench_arrow_mmap.py [linhas] [processos]
+"""
+import multiprocessing as mp
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import app  # noqa: E402
+
+
+def _memoria_privada():
+    kb = 0
+    with open("/proc/self/smaps_rollup") as f:
+        for linha in f:
+            if linha.startswith(("Private_Clean:", "Private_Dirty:")):
+                kb += int(linha.split()[1])
+    return kb * 1024
+
+
+def _worker(modo, caminho, inicio, fim, fila):
+    base = _memoria_privada()
+    df = pd.read_parquet(caminho) if modo == "parquet" else app._open_arrow_cache(Path(caminho))
+    # toca todas as colunas, como as páginas fazem ao montar o cubo
+    for c in df.columns:
+        s = df[c].cat.codes if isinstance(df[c].dtype, pd.CategoricalDtype) else df[c]
+        np.asarray(s).view("uint8").sum()
+    inicio.wait()
+    fila.put(_memoria_privada() - base)
+    fim.wait()
+
+
+def _medir(modo, caminho, processos):
+    inicio, fim, fila = mp.Barrier(processos + 1), mp.Barrier(processos + 1), mp.Queue()
+    workers = [mp.Process(target=_worker, args=(modo, caminho, inicio, fim, fila)) for _ in range(processos)]
+    for w in workers:
+        w.start()
+    inicio.wait()
+    medidas = [fila.get() for _ in workers]
+    fim.wait()
+    for w in workers:
+        w.join()
+    return sum(medidas) / len(medidas)
+
+
+def main():
+    linhas = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    processos = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    tx = app.normalize_schema(app.generate_example_data(num_rows=linhas), nome="bench")
+
+    pasta = Path(tempfile.mkdtemp())
+    parquet, arrow = pasta / "transacoes.parquet", pasta / "transacoes.arrow"
+    tx.to_parquet(parquet, index=False)
+    app._write_arrow_cache(tx, "bench", arrow)
+
+    antes = _medir("parquet", parquet, processos)
+    depois = _medir("arrow", arrow, processos)
+
+    print(f"{linhas:,} transações, {processos} processos "
+          f"({tx.memory_usage(deep=True).sum() / 2**20:.0f} MB em memória)")
+    print(f"antes  (Parquet, cópia por processo): {antes / 2**20:7.1f} MB privados por processo")
+    print(f"depois (Arrow mapeado):               {depois / 2**20:7.1f} MB privados por processo")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Benchmark: carga dos datasets na primeira abertura x depois da carga em segundo plano.
+
+"Antes": cada dataset registrado é lido da planilha, sem cache (como na
+primeira abertura do app). "Depois": preload_spreadsheets já leu as
+planilhas (uma de cada vez, como a thread de fundo faz depois do login) e os
+datasets são lidos das cópias em Parquet/Arrow. Mostra o tempo de cada
+arquivo e o total; os dois lados começam com uma pasta de cache vazia.
+
+Uso (na raiz do projeto):
+    python benchmarks/bench_carga_inicial.py [dataset ...]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app  # noqa: E402
+
+
+def _ler(names):
+    tempos = {}
+    for name in names:
+        t0 = time.perf_counter()
+        app._read_dataset(name)
+        tempos[name] = time.perf_counter() - t0
+    return tempos
+
+
+def main():
+    names = sys.argv[1:] or list(app.DATASETS)
+
+    with tempfile.TemporaryDirectory() as pasta:
+        app.CACHE_DIR = Path(pasta) / "antes"
+        antes = _ler(names)
+        app.CACHE_DIR = Path(pasta) / "depois"
+        t0 = time.perf_counter()
+        app.preload_spreadsheets(names)
+        preload = time.perf_counter() - t0
+        depois = _ler(names)
+
+    print(f"{'dataset':<12} {'antes (s)':>10} {'depois (s)':>11}")
+    for name in names:
+        print(f"{name:<12} {antes[name]:10.2f} {depois[name]:11.2f}")
+    print(f"{'total':<12} {sum(antes.values()):10.2f} {sum(depois.values()):11.2f}"
+          f"   (+ {preload:.2f} s de carga em segundo plano)")
+
+
+if __name__ == "__main__":
+    main()
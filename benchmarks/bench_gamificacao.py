@@ -0,0 +1,66 @@
+"""
+Benchmark: "🚀 Executar Simulação" cupom a cupom x em lote.
+
+Compara N chamadas de atualizar_usuario_gamificacao (uma leitura + uma
+gravação por cupom) com uma chamada de atualizar_usuario_gamificacao_lote
+(uma leitura + uma gravação no total), num banco temporário com vários usuários.
+
+Uso (na raiz do projeto):
+    python benchmarks/bench_gamificacao.py [num_cupons] [num_usuarios]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app  # noqa: E402
+
+
+def _novo_repo(pasta, num_usuarios):
+    repo = app.RepositorioUsuariosSQLite(Path(pasta) / "bench.db")
+    for i in range(num_usuarios):
+        repo.salvar({"nome": f"Usuário {i}", "email": f"user{i}@bench.com", "senha_hash": "x"})
+    return repo
+
+
+def _cupons(n):
+    tipos = ["Desconto", "Cashback", "Fidelidade"]
+    return [{"loja": f"Loja Simulada {i+1}", "tipo": tipos[i % 3], "valor": 100.0, "local": "Simulação"}
+            for i in range(n)]
+
+
+def main():
+    num_cupons = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    num_usuarios = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    email = "user0@bench.com"
+    cupons = _cupons(num_cupons)
+
+    with tempfile.TemporaryDirectory() as pasta:
+        repo = _novo_repo(pasta, num_usuarios)
+        app.get_user_repo = lambda: repo
+
+        t0 = time.perf_counter()
+        for cupom in cupons:
+            app.atualizar_usuario_gamificacao(email, cupom)
+        t_loop = time.perf_counter() - t0
+        estado_loop = repo.buscar(email)
+
+        repo.salvar({"nome": "Usuário 0", "email": email, "senha_hash": "x"})  # volta ao zero
+        t0 = time.perf_counter()
+        app.atualizar_usuario_gamificacao_lote(email, cupons)
+        t_lote = time.perf_counter() - t0
+        estado_lote = repo.buscar(email)
+
+    assert estado_loop["cupons_usados"] == estado_lote["cupons_usados"] == num_cupons
+    assert estado_loop["nivel"] == estado_lote["nivel"]
+
+    print(f"{num_cupons} cupons, {num_usuarios} usuários no banco")
+    print(f"  cupom a cupom: {t_loop * 1000:8.1f} ms")
+    print(f"  em lote:       {t_lote * 1000:8.1f} ms")
+    print(f"  ganho:         {t_loop / max(t_lote, 1e-9):8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
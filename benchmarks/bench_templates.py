@@ -0,0 +1,130 @@
+"""
+Benchmark: o visual do CupomGO aplicado em cada gráfico x guardado em templates.
+
+"Explícito" é o que o app faz: style_fig e time_axes_enhance chamam
+update_layout/update_xaxes/update_yaxes em cada gráfico. "Só template" é a
+alternativa testada: o visual e o range selector registrados como templates
+do Plotly ("cupomgo" como padrão e "cupomgo_tempo" para séries temporais).
+
+"Só template" é mais rápido, mas só porque pula justamente o que se perde: o
+st.plotly_chart mistura o tema do Streamlit por cima do template no navegador
+e fontes, fundos e eixos que estiverem só lá somem. "Template + visual
+explícito" é a versão que desenharia certo, e aí o ganho desaparece (o Plotly
+também valida e copia o template de novo a cada gráfico).
+
+Uso (na raiz do projeto):
+    python benchmarks/bench_templates.py [repeticoes]
+"""
+import copy
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import plotly.express as px  # noqa: E402
+import plotly.io as pio  # noqa: E402
+
+import app  # noqa: E402
+
+
+# ---- A alternativa com templates ----
+EIXO = dict(title_font=dict(color="black", size=12), tickfont=dict(color="black", size=11),
+            gridcolor="lightgray", zerolinecolor="lightgray", showgrid=True)
+LEGENDA = dict(orientation="h", yanchor="bottom", y=-0.35, xanchor="center", x=0.5,
+               bgcolor="rgba(255,255,255,0.9)", bordercolor="lightgray",
+               borderwidth=1, font=dict(size=11))
+
+
+def _registrar_templates():
+    base = copy.deepcopy(pio.templates["streamlit"])
+    base.layout.update(
+        font=dict(color="black", size=12), paper_bgcolor="white", plot_bgcolor="white",
+        hovermode="x unified",
+        hoverlabel=dict(bgcolor="white", font_color="black", font_size=12,
+                        bordercolor="lightgray", namelength=-1),
+        title_font=dict(color="black", size=16), xaxis=EIXO, yaxis=EIXO,
+    )
+    tempo = copy.deepcopy(base)
+    tempo.layout.xaxis.update(
+        rangeselector=dict(buttons=[
+            dict(count=1, label="1m", step="month", stepmode="backward"),
+            dict(count=3, label="3m", step="month", stepmode="backward"),
+            dict(count=6, label="6m", step="month", stepmode="backward"),
+            dict(count=1, label="YTD", step="year", stepmode="todate"),
+            dict(count=1, label="1a", step="year", stepmode="backward"),
+            dict(step="all", label="Tudo")
+        ]),
+        rangeslider=dict(visible=True),
+        type="date"
+    )
+    tempo.layout.update(dragmode="zoom", modebar_add=["v1hovermode", "toggleSpikelines", "toImage"])
+    pio.templates["cupomgo"] = base
+    pio.templates["cupomgo_tempo"] = tempo
+
+
+def _style_fig_template(fig, y_fmt=None):
+    fig.update_layout(legend=LEGENDA, margin=dict(l=80, r=80, t=80, b=140))
+    if y_fmt is not None:
+        fig.update_yaxes(tickformat=y_fmt)
+    return fig
+
+
+def _style_fig_template_explicito(fig, y_fmt=None):
+    fig.update_layout(
+        font=dict(color="black", size=12), paper_bgcolor="white", plot_bgcolor="white",
+        hoverlabel=dict(bgcolor="white", font_color="black", font_size=12,
+                        bordercolor="lightgray", namelength=-1),
+        title_font=dict(color="black", size=16),
+        legend=LEGENDA, margin=dict(l=80, r=80, t=80, b=140)
+    )
+    fig.update_xaxes(**EIXO)
+    fig.update_yaxes(**EIXO, **({"tickformat": y_fmt} if y_fmt is not None else {}))
+    return fig
+
+
+def _time_axes_template(fig):
+    fig.update_layout(template="cupomgo_tempo")
+    return fig
+
+
+def _graficos(dados, por_loja, style, tempo):
+    """Os dois tipos de gráfico mais comuns do app: série temporal e barras."""
+    serie = px.line(dados, x="Periodo", y="Receita", title="Receita por período", markers=True)
+    tempo(style(serie, y_fmt=",.2f"))
+    barras = px.bar(por_loja, x="Loja", y="Receita", color="Loja", title="Receita por loja")
+    style(barras, y_fmt=",.2f")
+
+
+def _medir(repeticoes, *args):
+    _graficos(*args)  # aquece (imports preguiçosos do plotly)
+    t0 = time.perf_counter()
+    for _ in range(repeticoes):
+        _graficos(*args)
+    return (time.perf_counter() - t0) / repeticoes * 1000
+
+
+def main():
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    rng = np.random.default_rng(42)
+    dados = pd.DataFrame({"Periodo": pd.date_range("2024-01-01", periods=80, freq="W-MON"),
+                          "Receita": rng.uniform(1_000, 5_000, 80)})
+    por_loja = pd.DataFrame({"Loja": list(app.EXEMPLO_LOJAS), "Receita": rng.uniform(1e4, 9e4, len(app.EXEMPLO_LOJAS))})
+
+    _registrar_templates()
+    pio.templates.default = "streamlit"
+    explicito = _medir(repeticoes, dados, por_loja, app.style_fig, app.time_axes_enhance)
+    pio.templates.default = "cupomgo"
+    template = _medir(repeticoes, dados, por_loja, _style_fig_template, _time_axes_template)
+    completo = _medir(repeticoes, dados, por_loja, _style_fig_template_explicito, _time_axes_template)
+    pio.templates.default = "streamlit"
+
+    print(f"explícito (style_fig / time_axes_enhance): {explicito:7.1f} ms por par de gráficos")
+    print(f"só template (perde o visual no Streamlit): {template:7.1f} ms  ({explicito / template:.2f}x)")
+    print(f"template + visual explícito:               {completo:7.1f} ms  ({explicito / completo:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
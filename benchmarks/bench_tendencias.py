@@ -0,0 +1,60 @@
+"""
+Benchmark: somas da página de tendências, um groupby por gráfico x uma passada.
+
+"Antes": o cubo era copiado, ganhava colunas derivadas (mês, dia da semana,
+hora) e cada gráfico fazia o seu groupby. "Depois": tendencias_bundle codifica
+as dimensões em inteiros e soma tudo com np.bincount.
+
+Uso (na raiz do projeto):
+    python benchmarks/bench_tendencias.py [linhas]
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app  # noqa: E402
+
+
+def _somas_antigas(cubo):
+    cubo = cubo[cubo["dia"].notna() & cubo["loja"].notna() & cubo["tipo"].notna()].copy()
+    cubo["Receita"] = cubo["valor_cupom_soma"]
+    cubo["Cupons"] = cubo["valor_cupom_n"]
+    cubo["Mês"] = cubo["dia"].dt.to_period("M").astype(str)
+    cubo["Dia_Semana_Num"] = cubo["dia_semana"].astype(int)
+    cubo["Hora"] = cubo["hora"].astype(int)
+    cubo["Dia_Semana"] = cubo["Dia_Semana_Num"].map(app.DIAS_SEMANA_PT)
+    cubo.groupby("Mês").agg(Receita=("Receita", "sum"), Cupons=("Cupons", "sum"))
+    cubo.groupby(["Dia_Semana_Num", "Dia_Semana"])["Cupons"].sum()
+    cubo.groupby("Hora")["Cupons"].sum()
+    cubo.groupby("loja")[["Receita", "Cupons"]].sum()
+    cubo.groupby("categoria")["Receita"].sum()
+    cubo.groupby("tipo")["Cupons"].sum()
+    cubo.groupby("tipo")["Receita"].sum()
+
+
+def _medir(funcao, cubo, repeticoes=5):
+    funcao(cubo)
+    t0 = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao(cubo)
+    return (time.perf_counter() - t0) / repeticoes * 1000
+
+
+def main():
+    linhas = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    cubo, _ = app.build_transaction_cube(app.generate_example_data(num_rows=linhas))
+
+    antes = _medir(_somas_antigas, cubo)
+    depois = _medir(app.tendencias_bundle, cubo)
+
+    print(f"cubo: {len(cubo):,} células ({linhas:,} transações)")
+    print(f"antes  (um groupby por gráfico): {antes:8.1f} ms")
+    print(f"depois (uma passada, bincount):  {depois:8.1f} ms")
+    if depois > 0:
+        print(f"ganho: {antes / depois:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark: "Top N lojas por Receita" do CFO, groupby no cubo x resumo da ingestão.
+
+"Antes": cada mudança de filtro agrupava o cubo inteiro por loja e ordenava.
+"Depois": top_lojas responde a partir de meta["top_lojas"] (Space-Saving com
+totais exatos), sem tocar no cubo. Também mede o custo que foi para a
+ingestão: montar o resumo de um cubo e somar o resumo de um lote novo.
+
+Uso (na raiz do projeto):
+    python benchmarks/bench_top_lojas.py [lojas] [celulas]
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import app  # noqa: E402
+
+
+def _cubo(rng, lojas, celulas, dias):
+    """Cubo sintético: poucas lojas grandes e uma cauda longa (Zipf)."""
+    nomes = np.array([f"Loja {i:06d}" for i in range(lojas)], dtype=object)
+    dia = pd.Timestamp("2024-01-01") + pd.to_timedelta(np.sort(rng.integers(0, dias, celulas)), unit="D")
+    return pd.DataFrame({
+        "dia": dia,
+        "loja": nomes[(rng.zipf(1.3, celulas) - 1) % lojas],
+        "tipo": rng.choice(np.array(["Desconto", "Cashback"], dtype=object), celulas),
+        "categoria": "Varejo",
+        "hora": rng.integers(0, 24, celulas),
+        "dia_semana": dia.weekday,
+        "valor_soma": rng.uniform(10, 500, celulas).round(2),
+        "valor_n": rng.integers(1, 20, celulas),
+    })
+
+
+def _top_groupby(cubo, n):
+    agg = cubo.groupby("loja").agg(Receita=("valor_soma", "sum"), Transacoes=("valor_n", "sum")).reset_index()
+    return agg.sort_values("Receita", ascending=False).head(n)
+
+
+def _medir(funcao, repeticoes=5):
+    funcao()
+    t0 = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+    return (time.perf_counter() - t0) / repeticoes * 1000
+
+
+def main():
+    lojas = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    celulas = int(sys.argv[2]) if len(sys.argv) > 2 else 2_000_000
+    rng = np.random.default_rng(42)
+    cubo = _cubo(rng, lojas, celulas, 365)
+    delta = _cubo(rng, lojas, celulas // 365, 1)
+    delta = delta.assign(dia=cubo["dia"].max(), dia_semana=cubo["dia"].max().weekday())
+
+    resumo = app.top_lojas_resumo(cubo)
+    n_celulas = len(cubo)
+    certo = _top_groupby(cubo, 10)["loja"].sort_values().tolist()
+    assert app.top_lojas(resumo, 10, n_celulas)["loja"].tolist() == certo
+
+    antes = _medir(lambda: _top_groupby(cubo, 10))
+    depois = _medir(lambda: app.top_lojas(resumo, 10, n_celulas), repeticoes=200)
+    montar = _medir(lambda: app.top_lojas_resumo(cubo), repeticoes=2)
+    juntos = app.merge_cubes(cubo, delta)
+    resumo_delta = app.top_lojas_resumo(delta)
+    somar = _medir(lambda: app.merge_top_lojas(resumo, resumo_delta, juntos), repeticoes=2)
+
+    print(f"cubo: {n_celulas:,} células, {cubo['loja'].nunique():,} lojas; lote novo: {len(delta):,} células")
+    print(f"antes  (groupby por loja a cada consulta): {antes:10.2f} ms")
+    print(f"depois (top_lojas no resumo):              {depois:10.3f} ms")
+    if depois > 0:
+        print(f"ganho: {antes / depois:,.0f}x")
+    print(f"ingestão: montar o resumo {montar:.1f} ms, somar um lote {somar:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()